@@ -0,0 +1,342 @@
+"""
+Admission control for the dashboard API.
+
+Every route shares one event loop and one Mongo pool, so a single busy guild
+(or a raid flooding /bot/sync) can push latency up for everybody. This module
+puts a cheap gate in front of the app:
+
+- a token bucket and a concurrency cap per guild (requests without a valid
+  token share one anonymous bucket, so nobody can drain a guild's budget
+  without credentials),
+- a concurrency cap per route,
+- a global priority gate where bot traffic (carrying the bot's key) is served
+  before dashboard reads and skips the per-guild limits, and requests that
+  wait too long in the queue are shed.
+
+Rejected requests get an immediate 429 (tenant/route over its limit) or 503
+(server overloaded) with a Retry-After header instead of timing out.
+"""
+
+import asyncio
+import heapq
+import hmac
+import itertools
+import json
+import math
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+# Priority classes, lower is served first
+PRIORITY_BOT = 0
+PRIORITY_DASHBOARD = 1
+
+_GUILD_PATH = re.compile(r"^/api/(?:guilds|bot/settings)/(\d+)")
+_ID_SEGMENT = re.compile(r"^(\d+|[0-9a-fA-F-]{32,36})$")
+
+# Tenant key for guild requests made without credentials
+ANONYMOUS = "anonymous"
+
+
+class TokenBucket:
+    """Classic token bucket refilled continuously at `rate` tokens per second"""
+
+    def __init__(self, rate: float, capacity: float, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self._clock = clock
+        self._updated = clock()
+
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self, amount: float = 1.0) -> Tuple[bool, float]:
+        """Take `amount` tokens; returns (allowed, seconds until it would be allowed)"""
+        self._refill()
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return True, 0.0
+        if self.rate <= 0:
+            return False, float("inf")
+        return False, (amount - self.tokens) / self.rate
+
+
+class PriorityGate:
+    """Concurrency limiter whose waiters are woken in priority order"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self._waiters = []
+        self._seq = itertools.count()
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for _, _, fut in self._waiters if not fut.done())
+
+    async def acquire(self, priority: int, timeout: float) -> bool:
+        """Wait up to `timeout` seconds for a slot; False means the request should be shed"""
+        if self.active < self.limit and not self.queued:
+            self.active += 1
+            return True
+        if timeout <= 0:
+            return False
+
+        fut = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), fut))
+        try:
+            await asyncio.wait_for(asyncio.shield(fut), timeout)
+            return True
+        except asyncio.TimeoutError:
+            if fut.done() and not fut.cancelled():
+                # The slot was handed over just as we gave up; pass it on
+                self.release()
+            else:
+                fut.cancel()
+            return False
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                self.release()
+            else:
+                fut.cancel()
+            raise
+
+    def release(self):
+        while self._waiters:
+            _, _, fut = heapq.heappop(self._waiters)
+            if not fut.done():
+                # Hand the slot straight to the next waiter, active stays the same
+                fut.set_result(True)
+                return
+        self.active -= 1
+
+
+class Rejection(Exception):
+    """Raised by AdmissionController.admit when a request must not run"""
+
+    def __init__(self, status_code: int, detail: str, retry_after: float):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class AdmissionController:
+    """Decides whether a request may run, and tracks what is currently running"""
+
+    def __init__(
+        self,
+        max_concurrency: int = 64,
+        route_concurrency: int = 32,
+        guild_concurrency: int = 8,
+        guild_rate: float = 20.0,
+        guild_burst: float = 40.0,
+        max_queue_time: float = 0.5,
+        bot_max_queue_time: float = 2.0,
+        max_guild_buckets: int = 10000,
+        clock=time.monotonic,
+    ):
+        self.gate = PriorityGate(max_concurrency)
+        self.route_concurrency = route_concurrency
+        self.guild_concurrency = guild_concurrency
+        self.guild_rate = guild_rate
+        self.guild_burst = guild_burst
+        self.max_queue_time = max_queue_time
+        self.bot_max_queue_time = bot_max_queue_time
+        self.max_guild_buckets = max_guild_buckets
+        self._clock = clock
+        self._route_active: Dict[str, int] = {}
+        self._guild_active: Dict[str, int] = {}
+        # Least recently used first, capped at max_guild_buckets
+        self._guild_buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self.stats = {"admitted": 0, "rate_limited": 0, "shed": 0}
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        return cls(
+            max_concurrency=int(os.environ.get('ADMISSION_MAX_CONCURRENCY', '64')),
+            route_concurrency=int(os.environ.get('ADMISSION_ROUTE_CONCURRENCY', '32')),
+            guild_concurrency=int(os.environ.get('ADMISSION_GUILD_CONCURRENCY', '8')),
+            guild_rate=float(os.environ.get('ADMISSION_GUILD_RATE', '20')),
+            guild_burst=float(os.environ.get('ADMISSION_GUILD_BURST', '40')),
+            max_queue_time=float(os.environ.get('ADMISSION_MAX_QUEUE_TIME', '0.5')),
+            bot_max_queue_time=float(os.environ.get('ADMISSION_BOT_MAX_QUEUE_TIME', '2.0')),
+            max_guild_buckets=int(os.environ.get('ADMISSION_MAX_GUILD_BUCKETS', '10000')),
+        )
+
+    @staticmethod
+    def route_key(method: str, path: str) -> str:
+        """Collapse snowflakes and UUIDs so all guilds share one per-route counter"""
+        parts = ["{id}" if _ID_SEGMENT.match(p) else p for p in path.split("/")]
+        return f"{method} {'/'.join(parts)}"
+
+    @staticmethod
+    def guild_of(path: str) -> Optional[str]:
+        match = _GUILD_PATH.match(path)
+        return match.group(1) if match else None
+
+    @staticmethod
+    def priority_of(path: str) -> int:
+        return PRIORITY_BOT if path.startswith("/api/bot/") else PRIORITY_DASHBOARD
+
+    def _guild_bucket(self, guild_id: str) -> TokenBucket:
+        bucket = self._guild_buckets.get(guild_id)
+        if bucket is None:
+            bucket = TokenBucket(self.guild_rate, self.guild_burst, clock=self._clock)
+            self._guild_buckets[guild_id] = bucket
+            if len(self._guild_buckets) > self.max_guild_buckets:
+                # Forgetting an idle bucket only hands that guild a fresh burst
+                self._guild_buckets.popitem(last=False)
+        else:
+            self._guild_buckets.move_to_end(guild_id)
+        return bucket
+
+    async def admit(self, method: str, path: str, authenticated: bool = True, bot: bool = True) -> "Ticket":
+        """Admit a request or raise Rejection; the returned ticket must be released
+
+        `authenticated` means the caller's token was verified; `bot` means the
+        caller proved it is the bot, without which bot routes get no priority.
+        """
+        route = self.route_key(method, path)
+        guild_id = self.guild_of(path)
+        priority = self.priority_of(path) if bot else PRIORITY_DASHBOARD
+        if guild_id is not None and not authenticated:
+            guild_id = ANONYMOUS
+
+        if guild_id is not None and priority != PRIORITY_BOT:
+            if self._guild_active.get(guild_id, 0) >= self.guild_concurrency:
+                self.stats["rate_limited"] += 1
+                raise Rejection(429, "Too many concurrent requests for this guild", 1)
+            allowed, wait = self._guild_bucket(guild_id).try_acquire()
+            if not allowed:
+                self.stats["rate_limited"] += 1
+                raise Rejection(429, "Rate limit exceeded for this guild", wait)
+
+        if self._route_active.get(route, 0) >= self.route_concurrency:
+            self.stats["rate_limited"] += 1
+            raise Rejection(429, "Too many concurrent requests for this route", 1)
+
+        # Reserve the tenant/route slots while queueing so a burst cannot overshoot them
+        self._route_active[route] = self._route_active.get(route, 0) + 1
+        if guild_id is not None:
+            self._guild_active[guild_id] = self._guild_active.get(guild_id, 0) + 1
+        ticket = Ticket(self, route, guild_id)
+
+        timeout = self.bot_max_queue_time if priority == PRIORITY_BOT else self.max_queue_time
+        try:
+            admitted = await self.gate.acquire(priority, timeout)
+        except BaseException:
+            ticket.release(holds_gate=False)
+            raise
+        if not admitted:
+            ticket.release(holds_gate=False)
+            self.stats["shed"] += 1
+            raise Rejection(503, "Server overloaded, try again later", timeout)
+
+        self.stats["admitted"] += 1
+        return ticket
+
+    def snapshot(self) -> dict:
+        return {
+            **self.stats,
+            "active": self.gate.active,
+            "queued": self.gate.queued,
+            "limit": self.gate.limit,
+        }
+
+
+class Ticket:
+    """Slots held by one admitted request"""
+
+    def __init__(self, controller: AdmissionController, route: str, guild_id: Optional[str]):
+        self._controller = controller
+        self._route = route
+        self._guild_id = guild_id
+        self._released = False
+
+    def release(self, holds_gate: bool = True):
+        if self._released:
+            return
+        self._released = True
+        controller = self._controller
+        _decrement(controller._route_active, self._route)
+        if self._guild_id is not None:
+            _decrement(controller._guild_active, self._guild_id)
+        if holds_gate:
+            controller.gate.release()
+
+
+def _decrement(counters: Dict[str, int], key: str):
+    remaining = counters.get(key, 0) - 1
+    if remaining > 0:
+        counters[key] = remaining
+    else:
+        counters.pop(key, None)
+
+
+class AdmissionMiddleware:
+    """Pure ASGI middleware so rejections never touch the routing/dependency stack
+
+    `verify_token` checks a bearer token cheaply (e.g. a JWT signature) and
+    `bot_key` is the shared secret the bot sends as X-Bot-Key; without them no
+    request counts as authenticated or as the bot.
+    """
+
+    def __init__(
+        self,
+        app,
+        controller: AdmissionController,
+        exempt_paths=("/", "/api/health", "/api/ready"),
+        verify_token: Optional[Callable[[str], bool]] = None,
+        bot_key: Optional[str] = None,
+    ):
+        self.app = app
+        self.controller = controller
+        self.exempt_paths = set(exempt_paths)
+        self.verify_token = verify_token
+        self.bot_key = bot_key.encode() if bot_key else None
+
+    def _credentials(self, scope) -> Tuple[bool, bool]:
+        headers = dict(scope["headers"])
+        scheme, _, token = headers.get(b"authorization", b"").decode("latin-1").partition(" ")
+        authenticated = (
+            self.verify_token is not None and scheme.lower() == "bearer" and bool(token) and self.verify_token(token)
+        )
+        bot = self.bot_key is not None and hmac.compare_digest(headers.get(b"x-bot-key", b""), self.bot_key)
+        return authenticated, bot
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.exempt_paths or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        try:
+            authenticated, bot = self._credentials(scope)
+            ticket = await self.controller.admit(scope["method"], scope["path"], authenticated, bot)
+        except Rejection as rejection:
+            await _send_rejection(send, rejection)
+            return
+
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            ticket.release()
+
+
+async def _send_rejection(send, rejection: Rejection):
+    body = json.dumps({"detail": rejection.detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": rejection.status_code,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(rejection.retry_after).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,95 @@
+"""
+Build moderation profiles (see profiles.py) from the actions already stored.
+
+Profiles are kept current on every synced action, but actions stored before
+they existed were never counted. Run this once after deploying profiles:
+
+    python backfill_profiles.py [--batch-size 1000]
+
+Each profile is set from its user's full history (counts per action type, the
+newest action, mute and ban state), so it is safe to re-run and a re-run fixes
+anything a previous one got wrong. A sync for a user landing between the read
+of their history and the write of their profile is lost from the counters, so
+run it while traffic is low, or run it twice.
+"""
+
+import argparse
+import asyncio
+import logging
+from pathlib import Path
+from typing import Dict, List
+
+from pymongo import UpdateOne
+
+from partitioning import Partition, PartitionRouter
+from profiles import history_update
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+# One row per (guild, user, action type), grouped so each user's rows are adjacent
+HISTORY_PIPELINE = [
+    {"$sort": {"timestamp": 1}},
+    {"$group": {
+        "_id": {"guild_id": "$guild_id", "user_id": "$user_id", "action_type": "$action_type"},
+        "count": {"$sum": 1},
+        "last": {"$last": "$$ROOT"},
+    }},
+    {"$sort": {"_id.guild_id": 1, "_id.user_id": 1}},
+]
+
+
+def _profile_request(user: tuple, groups: List[Dict]) -> UpdateOne:
+    return UpdateOne({"guild_id": user[0], "user_id": user[1]}, history_update(groups), upsert=True)
+
+
+async def backfill(part: Partition, batch_size: int = BATCH_SIZE) -> int:
+    """Set every profile in a partition from its user's actions; returns how many"""
+    profiles = part.db.moderation_profiles
+    requests: List[UpdateOne] = []
+    user, groups, total = None, [], 0
+    async for row in part.storage.actions.aggregate(HISTORY_PIPELINE, allowDiskUse=True):
+        key = (row["_id"]["guild_id"], row["_id"]["user_id"])
+        if key != user:
+            if groups:
+                requests.append(_profile_request(user, groups))
+            user, groups = key, []
+        groups.append({"action_type": row["_id"]["action_type"], "count": row["count"], "last": row["last"]})
+        if len(requests) >= batch_size:
+            await profiles.bulk_write(requests, ordered=False)
+            total += len(requests)
+            requests = []
+    if groups:
+        requests.append(_profile_request(user, groups))
+    if requests:
+        await profiles.bulk_write(requests, ordered=False)
+        total += len(requests)
+    logger.info(f"Partition {part.name}: backfilled {total} profiles")
+    return total
+
+
+def main():
+    from dotenv import load_dotenv
+
+    load_dotenv(Path(__file__).parent / '.env')
+    parser = argparse.ArgumentParser(description="Build moderation profiles from stored actions")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    router = PartitionRouter.from_env()
+
+    async def run():
+        await router.refresh()
+        for part in router.partitions:
+            await backfill(part, args.batch_size)
+
+    try:
+        asyncio.run(run())
+    finally:
+        router.close()
+
+
+if __name__ == "__main__":
+    main()
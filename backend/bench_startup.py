@@ -0,0 +1,118 @@
+"""
+Benchmark: API cold start, from process start to live and to ready.
+
+Starts the API in a fresh uvicorn process several times and reports, per run:
+
+- import: time to import server.py (measured in its own process);
+- live: process start until /api/health answers;
+- ready: process start until /api/ready answers 200;
+- startup_ms: the replica's own import-to-ready time from /api/ready.
+
+Usage:
+    python bench_startup.py [--runs 5] [--timeout 60]
+
+Needs the same environment as the API (MONGO_URL or MONGO_PARTITIONS); without
+a reachable Mongo the replica stays not-ready and only import/live are timed.
+"""
+
+import argparse
+import json
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).parent
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_import() -> float:
+    code = "import time; t = time.perf_counter(); import server; print(time.perf_counter() - t)"
+    out = subprocess.run(
+        [sys.executable, "-c", code], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+    )
+    return float(out.stdout.strip().splitlines()[-1]) * 1000
+
+
+def get(url: str):
+    """(status, json body) of a GET, or None if nothing is listening yet"""
+    try:
+        with urllib.request.urlopen(url, timeout=5) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read() or b"null")
+    except (urllib.error.URLError, ConnectionError):
+        return None
+
+
+def measure_start(timeout: float):
+    port = free_port()
+    base = f"http://127.0.0.1:{port}/api"
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    live = ready = None
+    body = None
+    try:
+        while time.perf_counter() - started < timeout:
+            if live is None and get(f"{base}/health") is not None:
+                live = (time.perf_counter() - started) * 1000
+            if live is not None:
+                result = get(f"{base}/ready")
+                if result is not None:
+                    status, body = result
+                    if status == 200:
+                        ready = (time.perf_counter() - started) * 1000
+                        break
+            time.sleep(0.02)
+    finally:
+        process.terminate()
+        process.wait()
+    return live, ready, body
+
+
+def summarize(name: str, values):
+    values = [v for v in values if v is not None]
+    if not values:
+        print(f"{name:>12}: never")
+        return
+    print(f"{name:>12}: median {statistics.median(values):8.1f} ms   max {max(values):8.1f} ms   ({len(values)} runs)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure API import-to-ready time")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds to wait for readiness per run")
+    args = parser.parse_args()
+
+    imports, lives, readies, reported = [], [], [], []
+    for run in range(args.runs):
+        imports.append(measure_import())
+        live, ready, body = measure_start(args.timeout)
+        lives.append(live)
+        readies.append(ready)
+        reported.append((body or {}).get("startup_ms"))
+        if ready is None and body is not None:
+            print(f"run {run + 1}: not ready after {args.timeout:.0f}s: {json.dumps(body.get('dependencies'))}")
+
+    summarize("import", imports)
+    summarize("live", lives)
+    summarize("ready", readies)
+    summarize("startup_ms", reported)
+
+
+if __name__ == "__main__":
+    main()
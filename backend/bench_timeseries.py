@@ -0,0 +1,125 @@
+"""
+Benchmark: standard vs time-series layout for moderation actions.
+
+Loads the same synthetic actions into both layouts in a scratch database and
+reports storage size plus per-guild time-range query latency (the access
+pattern of the listing, stats and export routes).
+
+Usage:
+    python bench_timeseries.py [--actions 500000] [--guilds 200] [--queries 200]
+
+Needs MONGO_URL pointing at a MongoDB 6.0+ server. The scratch database
+(`<DB_NAME>_bench` by default) is dropped at the end.
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from storage import STANDARD, TIMESERIES, ModerationStorage, count_actions
+
+ACTION_TYPES = ("warn", "warn", "warn", "mute", "kick", "ban")
+
+
+def synthetic_actions(count: int, guilds: int, days: int):
+    start = datetime.utcnow() - timedelta(days=days)
+    # Skewed like real traffic: a few big guilds produce most actions
+    weights = [1 / (i + 1) for i in range(guilds)]
+    guild_ids = [str(10**17 + i) for i in range(guilds)]
+    docs = [
+        {
+            "id": str(uuid.uuid4()),
+            "guild_id": random.choices(guild_ids, weights)[0],
+            "user_id": str(10**17 + random.randrange(50000)),
+            "action_type": random.choice(ACTION_TYPES),
+            "reason": "Sebep belirtilmedi",
+            "moderator_id": str(10**17 + random.randrange(50)),
+            "timestamp": start + timedelta(seconds=random.randrange(days * 86400)),
+            "duration": None,
+            "idempotency_key": None,
+        }
+        for _ in range(count)
+    ]
+    return docs, guild_ids
+
+
+async def load(store, docs, batch_size: int = 10000):
+    for i in range(0, len(docs), batch_size):
+        await store.collection.insert_many([dict(d) for d in docs[i:i + batch_size]], ordered=False)
+
+
+async def measure(collection, guild_ids, days: int, queries: int):
+    listing, stats = [], []
+    now = datetime.utcnow()
+    for _ in range(queries):
+        guild_id = random.choice(guild_ids[:20])
+        since = now - timedelta(days=random.randrange(1, days))
+        query = {"guild_id": guild_id, "timestamp": {"$gte": since, "$lt": since + timedelta(days=7)}}
+
+        started = time.perf_counter()
+        await collection.find(query).sort("timestamp", -1).limit(50).to_list(50)
+        listing.append((time.perf_counter() - started) * 1000)
+
+        started = time.perf_counter()
+        await count_actions(collection, query)
+        stats.append((time.perf_counter() - started) * 1000)
+    return listing, stats
+
+
+def summary(samples):
+    samples = sorted(samples)
+    return f"p50 {statistics.median(samples):7.2f} ms  p95 {samples[int(len(samples) * 0.95) - 1]:7.2f} ms"
+
+
+async def run(args):
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    client = AsyncIOMotorClient(os.environ.get('MONGO_URL', 'mongodb://localhost:27017'))
+    db = client[args.database]
+    await client.drop_database(args.database)
+    storage = ModerationStorage(db)
+
+    docs, guild_ids = synthetic_actions(args.actions, args.guilds, args.days)
+
+    try:
+        for mode in (STANDARD, TIMESERIES):
+            store = storage.stores[mode]
+            await store.ensure_indexes()
+            started = time.perf_counter()
+            await load(store, docs)
+            load_s = time.perf_counter() - started
+
+            coll_stats = await db.command("collStats", store.collection.name)
+            listing, stats = await measure(store.collection, guild_ids, args.days, args.queries)
+            print(f"== {mode} ({store.collection.name})")
+            print(f"   load        {load_s:8.1f} s for {len(docs)} actions")
+            print(f"   storage     {coll_stats.get('storageSize', 0) / 2**20:8.1f} MiB")
+            print(f"   indexes     {coll_stats.get('totalIndexSize', 0) / 2**20:8.1f} MiB")
+            print(f"   listing     {summary(listing)}")
+            print(f"   stats       {summary(stats)}")
+    finally:
+        await client.drop_database(args.database)
+        client.close()
+
+
+def main():
+    from dotenv import load_dotenv
+    from pathlib import Path
+
+    load_dotenv(Path(__file__).parent / '.env')
+    parser = argparse.ArgumentParser(description="Compare moderation action storage layouts")
+    parser.add_argument("--actions", type=int, default=500000)
+    parser.add_argument("--guilds", type=int, default=200)
+    parser.add_argument("--days", type=int, default=180)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--database", default=os.environ.get('DB_NAME', 'discord_bot') + "_bench")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Bulk moderation operations for raid cleanup.
+
+Both operations work in chunks: one store round trip (bulk_write / delete_many)
+and one profile bulk_write per chunk, and they yield a progress dict after each
+chunk so the route can stream it back to the dashboard.
+
+"Revert" deletes the matching actions like "delete" does, and also records an
+unban/unmute for each affected ban/mute, so profiles show the user as no longer
+banned/muted and the caller gets the list of users to lift on Discord.
+"""
+
+import uuid
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, Optional
+
+from profiles import record_actions, retract_actions
+
+DEFAULT_CHUNK_SIZE = 500
+
+# What reverting an action records
+_REVERSALS = {"ban": "unban", "mute": "unmute"}
+
+
+def build_filter(
+    guild_id: str,
+    moderator_id: Optional[str] = None,
+    user_ids: Optional[List[str]] = None,
+    action_types: Optional[List[str]] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> Dict:
+    query: Dict = {"guild_id": guild_id}
+    if moderator_id:
+        query["moderator_id"] = moderator_id
+    if user_ids:
+        query["user_id"] = {"$in": user_ids}
+    if action_types:
+        query["action_type"] = {"$in": action_types}
+    if since or until:
+        query["timestamp"] = {}
+        if since:
+            query["timestamp"]["$gte"] = since
+        if until:
+            query["timestamp"]["$lt"] = until
+    return query
+
+
+def revert_filter(query: Dict) -> Dict:
+    """Narrow `query` to what a revert acts on: never a reversal itself"""
+    return {"$and": [query, {"action_type": {"$nin": list(_REVERSALS.values())}}]}
+
+
+def _chunks(items: List, size: int):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+async def record_many(part, docs: List[Dict], chunk_size: int = DEFAULT_CHUNK_SIZE) -> AsyncIterator[Dict]:
+    """Store actions chunk by chunk; yields progress including the newly stored docs"""
+    processed = inserted = 0
+    for chunk in _chunks(docs, chunk_size):
+        fresh = await part.storage.current.insert_batch(chunk)
+        await record_actions(part.db.moderation_profiles, fresh)
+        processed += len(chunk)
+        inserted += len(fresh)
+        yield {"processed": processed, "total": len(docs), "inserted": inserted, "new": fresh}
+
+
+async def delete_matching(
+    part,
+    query: Dict,
+    revert: bool = False,
+    reverted_by: Optional[str] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> AsyncIterator[Dict]:
+    """Delete (or revert) every action matching `query`, chunk by chunk
+
+    Stops after the number of actions counted up front, so a raid still
+    writing matching actions can't keep the request running forever.
+    """
+    guild_id = query["guild_id"]
+    if revert:
+        # Never revert a reversal, and don't pick up the ones this request records
+        query = revert_filter(query)
+    actions = part.storage.actions
+    total = await actions.count_documents(query)
+    fields = {"_id": 1, "id": 1, "guild_id": 1, "user_id": 1, "action_type": 1, "idempotency_key": 1}
+    processed = deleted = 0
+
+    while processed < total:
+        # Re-query from the top each time: the previous chunk is gone by now
+        size = min(chunk_size, total - processed)
+        chunk = await actions.find(query, fields).limit(size).to_list(size)
+        if not chunk:
+            break
+        lifted = []
+        if revert:
+            now = datetime.utcnow()
+            reversals = [
+                {
+                    "id": str(uuid.uuid4()),
+                    "guild_id": action["guild_id"],
+                    "user_id": action["user_id"],
+                    "action_type": _REVERSALS[action["action_type"]],
+                    "reason": f"Reverted {action['action_type']} {action['id']}",
+                    "moderator_id": reverted_by or "",
+                    "timestamp": now,
+                    "duration": None,
+                    "idempotency_key": f"revert:{action['id']}",
+                }
+                for action in chunk if action["action_type"] in _REVERSALS
+            ]
+            # Reversals go in before the originals are deleted, so a failure in
+            # between leaves both and a retry (same revert: keys) just finishes
+            fresh = await part.storage.current.insert_batch(reversals)
+            await record_actions(part.db.moderation_profiles, fresh)
+            # Lifting is harmless to repeat, so report the whole chunk, retried rows included
+            lifted = [{"user_id": r["user_id"], "action_type": r["action_type"]} for r in reversals]
+
+        deleted += await part.storage.current.delete_batch(chunk)
+
+        counts: Dict[str, Dict[str, int]] = {}
+        for action in chunk:
+            per_type = counts.setdefault(action["user_id"], {})
+            per_type[action["action_type"]] = per_type.get(action["action_type"], 0) + 1
+        await retract_actions(part.db.moderation_profiles, guild_id, counts)
+
+        processed += len(chunk)
+        yield {"processed": processed, "total": total, "deleted": deleted, "lifted": lifted}
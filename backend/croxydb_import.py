@@ -0,0 +1,293 @@
+"""
+Bulk importer from the Discord bot's croxydb store into MongoDB.
+
+croxydb keeps everything in one flat JSON object (croxydb/croxydb.json by
+default). The bot's moderation state lives under these keys:
+
+    warnings_{guild}_{user}  -> [{id, reason, moderator, timestamp}, ...]
+    mute_{guild}_{user}      -> {userId, reason, moderator, timestamp, duration}
+    ban_{guild}_{user}       -> {userId, reason, moderator, timestamp}
+
+The file is parsed one top-level entry at a time, so memory stays bounded by
+the largest single value rather than the size of the store. Every record gets
+a deterministic idempotency key and is written idempotently on
+(guild_id, idempotency_key), so re-running an import (or resuming one) never
+creates duplicates.
+
+Actions a batch actually inserts are applied to their users' profiles (see
+profiles.py) as part of the same batch.
+
+Usage:
+    python croxydb_import.py path/to/croxydb.json [--batch-size 1000]
+        [--checkpoint import.checkpoint.json] [--resume]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, TextIO, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 1000
+_CHUNK_SIZE = 1 << 16
+_WHITESPACE = " \t\n\r"
+_decoder = json.JSONDecoder()
+
+
+class _Reader:
+    """Buffered character reader that hands out complete JSON values"""
+
+    def __init__(self, fp: TextIO, chunk_size: int):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, min_size: int) -> bool:
+        if self.eof:
+            return False
+        # Drop what was already consumed so the buffer never grows past one value
+        self.buf = self.buf[self.pos:]
+        self.pos = 0
+        data = self.fp.read(max(self.chunk_size, min_size))
+        if not data:
+            self.eof = True
+            return False
+        self.buf += data
+        return True
+
+    def peek(self) -> str:
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill(0):
+                raise ValueError("Unexpected end of croxydb file")
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise ValueError(f"Expected {char!r} at croxydb offset {self.pos}")
+        self.pos += 1
+
+    def value(self) -> Any:
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                # Value straddles the chunk boundary; read more (doubling) and retry
+                if not self._fill(len(self.buf)):
+                    raise
+                continue
+            if end == len(self.buf) and not self.eof and self._fill(0):
+                # A bare number could continue in the next chunk
+                continue
+            self.pos = end
+            return value
+
+
+def iter_entries(fp: TextIO, chunk_size: int = _CHUNK_SIZE) -> Iterator[Tuple[str, Any]]:
+    """Yield (key, value) pairs of a top-level JSON object without loading it whole"""
+    reader = _Reader(fp, chunk_size)
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+    while True:
+        key = reader.value()
+        reader.expect(":")
+        yield key, reader.value()
+        if reader.peek() == ",":
+            reader.pos += 1
+            continue
+        reader.expect("}")
+        return
+
+
+def _timestamp(value: Any) -> datetime:
+    # The bot stores Date.now(), i.e. milliseconds since the epoch
+    if isinstance(value, (int, float)):
+        return datetime.utcfromtimestamp(value / 1000)
+    return datetime.utcnow()
+
+
+def _action(guild_id: str, user_id: str, action_type: str, record: Dict, key: str) -> Dict:
+    return {
+        "id": key,
+        "guild_id": guild_id,
+        "user_id": user_id,
+        "action_type": action_type,
+        "reason": str(record.get("reason") or ""),
+        "moderator_id": str(record.get("moderator") or ""),
+        "timestamp": _timestamp(record.get("timestamp")),
+        "duration": record.get("duration"),
+        "idempotency_key": key,
+        "source": "croxydb",
+    }
+
+
+def map_entry(key: str, value: Any) -> List[Dict]:
+    """Map one croxydb entry to moderation action documents (empty if unrelated)"""
+    prefix, _, rest = key.partition("_")
+    guild_id, _, user_id = rest.partition("_")
+    if not guild_id or not user_id:
+        return []
+
+    if prefix == "warnings" and isinstance(value, list):
+        return [
+            _action(guild_id, user_id, "warn", w, f"croxydb:warn:{user_id}:{w.get('id') or w.get('timestamp')}")
+            for w in value if isinstance(w, dict)
+        ]
+    if prefix in ("mute", "ban") and isinstance(value, dict):
+        return [_action(guild_id, user_id, prefix, value, f"croxydb:{prefix}:{user_id}:{value.get('timestamp')}")]
+    return []
+
+
+class ImportProgress:
+    """Running totals, also used as the resume checkpoint"""
+
+    def __init__(self, entries: int = 0, actions: int = 0, inserted: int = 0, bytes_total: int = 0):
+        self.entries = entries
+        self.actions = actions
+        self.inserted = inserted
+        self.bytes_total = bytes_total
+        self.done = False
+        self.error: Optional[str] = None
+        # Size/mtime of the file being imported, so a checkpoint is never applied to another version of it
+        self.source: Optional[Dict] = None
+
+    def dict(self) -> Dict:
+        return {
+            "entries": self.entries,
+            "actions": self.actions,
+            "inserted": self.inserted,
+            "bytes_total": self.bytes_total,
+            "done": self.done,
+            "error": self.error,
+            "source": self.source,
+        }
+
+
+def _fingerprint(path: Path) -> Dict:
+    stat = path.stat()
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _load_checkpoint(path: Optional[Path], source: Dict) -> ImportProgress:
+    """Progress to resume from; a fresh start unless the checkpoint is an unfinished run of this exact file"""
+    if path is None or not path.exists():
+        return ImportProgress()
+    data = json.loads(path.read_text())
+    if data.get("done") or data.get("source") != source:
+        # The bot keeps rewriting croxydb: entry positions from another version mean nothing
+        logger.info(f"Ignoring checkpoint {path}: finished or taken from a different version of the file")
+        return ImportProgress()
+    return ImportProgress(data.get("entries", 0), data.get("actions", 0), data.get("inserted", 0))
+
+
+def _save_checkpoint(path: Optional[Path], progress: ImportProgress):
+    if path is None:
+        return
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps(progress.dict()))
+    tmp.replace(path)
+
+
+async def import_croxydb(
+    store,
+    path: Path,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    checkpoint: Optional[Path] = None,
+    resume: bool = False,
+    progress: Optional[ImportProgress] = None,
+    on_progress: Optional[Callable[[ImportProgress], None]] = None,
+) -> ImportProgress:
+    """Stream `path` into `store` (see storage.py) in idempotent batches of `batch_size` actions
+
+    With `resume`, entries already recorded in `checkpoint` are parsed but not
+    re-written, provided the checkpoint belongs to an unfinished import of the
+    same file (same size and mtime). The checkpoint is only advanced after a
+    batch is committed, so an interrupted run at worst replays one batch, which
+    the idempotent writes absorb.
+    """
+    path = Path(path)
+    source = _fingerprint(path)
+    saved = _load_checkpoint(checkpoint, source) if resume else ImportProgress()
+    progress = progress or ImportProgress()
+    progress.entries, progress.actions, progress.inserted = saved.entries, saved.actions, saved.inserted
+    progress.bytes_total = source["size"]
+    progress.source = source
+    skip = saved.entries
+
+    batch: List[Dict] = []
+    pending_entries = 0
+    with open(path, encoding="utf-8") as fp:
+        for index, (key, value) in enumerate(iter_entries(fp)):
+            if index < skip:
+                continue
+            batch.extend(map_entry(key, value))
+            pending_entries += 1
+            if len(batch) >= batch_size:
+                progress.inserted += len(await store.insert_batch(batch))
+                progress.actions += len(batch)
+                progress.entries += pending_entries
+                batch, pending_entries = [], 0
+                _save_checkpoint(checkpoint, progress)
+                if on_progress:
+                    on_progress(progress)
+            # Yield to the event loop between entries so an in-process import
+            # doesn't starve API requests while it parses
+            if index % 1000 == 0:
+                await asyncio.sleep(0)
+
+    if batch:
+        progress.inserted += len(await store.insert_batch(batch))
+        progress.actions += len(batch)
+    progress.entries += pending_entries
+    progress.done = True
+    _save_checkpoint(checkpoint, progress)
+    if on_progress:
+        on_progress(progress)
+    return progress
+
+
+def main():
+    from dotenv import load_dotenv
+    from partitioning import PartitionRouter, RoutedStore
+
+    load_dotenv(Path(__file__).parent / '.env')
+    parser = argparse.ArgumentParser(description="Import croxydb moderation data into MongoDB")
+    parser.add_argument("path", type=Path, help="croxydb JSON file")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--checkpoint", type=Path, default=None,
+                        help="checkpoint file (default: <path>.checkpoint.json)")
+    parser.add_argument("--resume", action="store_true", help="continue from the checkpoint")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    checkpoint = args.checkpoint or args.path.with_name(args.path.name + ".checkpoint.json")
+    router = PartitionRouter.from_env()
+
+    def report(progress: ImportProgress):
+        logger.info(f"Imported {progress.entries} entries, {progress.actions} actions "
+                    f"({progress.inserted} new)")
+
+    async def run():
+        await router.refresh()
+        await router.fan_out(lambda p: p.storage.current.ensure_indexes())
+        await import_croxydb(RoutedStore(router), args.path, args.batch_size, checkpoint, args.resume,
+                             on_progress=report)
+
+    try:
+        asyncio.run(run())
+    finally:
+        router.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Short-lived in-memory dedupe window for bot sync retries.
+
+The unique index on (guild_id, idempotency_key) is what guarantees a retried
+sync never creates a second row. This window only exists so that hot retries
+(the bot timing out and resending within seconds) are answered without a
+database round trip at all.
+"""
+
+import time
+from collections import OrderedDict
+from typing import Hashable
+
+
+class DedupeWindow:
+    """Bounded set of recently seen keys, each remembered for `ttl` seconds"""
+
+    def __init__(self, ttl: float = 300.0, max_size: int = 10000, clock=time.monotonic):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._clock = clock
+        self._seen: "OrderedDict[Hashable, float]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def _evict(self, now: float):
+        # Keys are kept in insertion order, so expired ones are always at the front
+        while self._seen:
+            key, expires = next(iter(self._seen.items()))
+            if expires > now and len(self._seen) <= self.max_size:
+                break
+            self._seen.popitem(last=False)
+
+    def seen(self, key: Hashable) -> bool:
+        now = self._clock()
+        self._evict(now)
+        expires = self._seen.get(key)
+        return expires is not None and expires > now
+
+    def add(self, key: Hashable):
+        now = self._clock()
+        self._seen.pop(key, None)
+        self._seen[key] = now + self.ttl
+        self._evict(now)
@@ -0,0 +1,153 @@
+"""
+Online migration of moderation actions between storage layouts (see storage.py).
+
+Copies `moderation_actions` into the time-series collection while the API
+keeps serving from the old one, then cuts over:
+
+1. mark: set `migrating` in `storage_config` and wait for replicas to notice;
+   from then on their deletes from the source leave tombstones (storage.py);
+2. copy: walk the source in `_id` order, in batches, recording the last
+   copied `_id` in `storage_config` so an interrupted run resumes;
+3. catch up: repeat the copy until a pass finds fewer than `--settle` new
+   documents;
+4. cut over: flip the mode in `storage_config`; replicas pick it up within
+   STORAGE_REFRESH_SECONDS;
+5. drain: wait out the refresh interval, copy anything that was still
+   written to the old collection meanwhile, then replay the tombstones so
+   actions deleted after they were copied don't come back.
+
+The source collection is left untouched; `--rollback` flips the mode back
+(actions written to the time-series collection after cutover are not copied
+back).
+
+With MONGO_PARTITIONS set, every partition is migrated in turn (or only the
+one named by `--partition`).
+
+Usage:
+    python migrate_timeseries.py [--batch-size 5000] [--settle 100] [--partition NAME] [--rollback]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from bson import ObjectId
+
+from storage import CONFIG_ID, STANDARD, TIMESERIES, TOMBSTONES_COLLECTION, ModerationStorage
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 5000
+# Writes from several replicas don't commit in strict _id order; only copy
+# documents older than this so a late commit below the checkpoint isn't skipped
+COPY_LAG = timedelta(seconds=5)
+
+
+async def copy_pass(storage: ModerationStorage, batch_size: int, lag: timedelta = COPY_LAG) -> int:
+    """Copy source documents after the recorded checkpoint; returns how many were copied"""
+    source = storage.stores[STANDARD].collection
+    target = storage.stores[TIMESERIES]
+    config = await storage.db.storage_config.find_one({"_id": CONFIG_ID}) or {}
+    last_id = config.get("migrated_until")
+
+    upper = ObjectId.from_datetime(datetime.utcnow() - lag)
+    copied = 0
+    while True:
+        query = {"_id": {"$lt": upper}}
+        if last_id is not None:
+            query["_id"]["$gt"] = last_id
+        batch = await source.find(query).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not batch:
+            return copied
+        last_id = batch[-1]["_id"]
+        for doc in batch:
+            # Time-series collections don't enforce _id uniqueness, so every copied
+            # doc claims a sync key; replaying a batch after a crash is then a no-op
+            doc["idempotency_key"] = doc.get("idempotency_key") or f"migrated:{doc['id']}"
+        await target.insert_many(batch)
+        await storage.db.storage_config.update_one(
+            {"_id": CONFIG_ID}, {"$set": {"migrated_until": last_id}}, upsert=True
+        )
+        copied += len(batch)
+        logger.info(f"Copied {copied} actions (up to _id {last_id})")
+
+
+async def replay_deletes(storage: ModerationStorage, batch_size: int) -> int:
+    """Delete the copies of actions deleted from the source during the migration"""
+    tombstones = storage.db[TOMBSTONES_COLLECTION]
+    target = storage.stores[TIMESERIES]
+    replayed = 0
+    while True:
+        batch = await tombstones.find({}).limit(batch_size).to_list(batch_size)
+        if not batch:
+            return replayed
+        await target.collection.delete_many({"$or": [{"guild_id": t["guild_id"], "id": t["id"]} for t in batch]})
+        await target.sync_keys.delete_many({"$or": [
+            {"guild_id": t["guild_id"], "idempotency_key": t["idempotency_key"]} for t in batch
+        ]})
+        await tombstones.delete_many({"_id": {"$in": [t["_id"] for t in batch]}})
+        replayed += len(batch)
+
+
+async def migrate(storage: ModerationStorage, batch_size: int, settle: int, refresh_seconds: float):
+    await storage.stores[TIMESERIES].ensure_indexes()
+
+    await storage.set_migrating(True)
+    logger.info(f"Recording deletes; waiting {refresh_seconds}s for replicas to follow")
+    await asyncio.sleep(refresh_seconds * 2)
+
+    while True:
+        copied = await copy_pass(storage, batch_size)
+        if copied < settle:
+            break
+
+    await storage.set_mode(TIMESERIES)
+    logger.info(f"Cut over to {TIMESERIES}; waiting {refresh_seconds}s for replicas to follow")
+    await asyncio.sleep(refresh_seconds * 2)
+    drained = await copy_pass(storage, batch_size, lag=timedelta(0))
+    replayed = await replay_deletes(storage, batch_size)
+    await storage.set_migrating(False)
+    logger.info(f"Migration complete ({drained} late writes drained, {replayed} deletes replayed)")
+
+
+def main():
+    from dotenv import load_dotenv
+    from partitioning import PartitionRouter
+
+    load_dotenv(Path(__file__).parent / '.env')
+    parser = argparse.ArgumentParser(description="Migrate moderation actions to a time-series collection")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--settle", type=int, default=100,
+                        help="cut over once a catch-up pass copies fewer documents than this")
+    parser.add_argument("--partition", help="only migrate this partition")
+    parser.add_argument("--rollback", action="store_true", help="switch the API back to the standard layout")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    router = PartitionRouter.from_env()
+    refresh_seconds = float(os.environ.get('STORAGE_REFRESH_SECONDS', '30'))
+    partitions = [router.by_name[args.partition]] if args.partition else router.partitions
+
+    async def run():
+        for partition in partitions:
+            # Partition storages default to MODERATION_STORAGE; start from the stored mode
+            await partition.storage.refresh()
+            if args.rollback:
+                await partition.storage.set_mode(STANDARD)
+                await partition.storage.set_migrating(False)
+                logger.info(f"{partition.name}: switched back to the standard layout")
+            else:
+                logger.info(f"{partition.name}: migrating")
+                await migrate(partition.storage, args.batch_size, args.settle, refresh_seconds)
+
+    try:
+        asyncio.run(run())
+    finally:
+        router.close()
+
+
+if __name__ == "__main__":
+    main()
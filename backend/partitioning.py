@@ -0,0 +1,263 @@
+"""
+Guild-sharded partitioning across several Mongo databases/clusters.
+
+Each partition is a (MONGO_URL, DB_NAME) pair with its own Motor client and
+pool. A guild's data (moderation actions, profiles, settings, AI settings)
+lives in exactly one partition, chosen by consistent hashing of the guild id,
+so adding a partition only moves ~1/N of the guilds. Global data (users,
+guild placements) stays in the first, primary partition.
+
+Configure with MONGO_PARTITIONS, a JSON list:
+
+    [{"name": "p0", "url": "mongodb://localhost:27017", "db": "discord_bot"},
+     {"name": "p1", "url": "mongodb://localhost:27018", "db": "discord_bot"}]
+
+Without it there is a single partition built from MONGO_URL / DB_NAME, which
+behaves exactly like the unpartitioned setup.
+
+With `lazy=True` no Motor client is built until `connect()`, so importing the
+API does no DNS/SRV lookups and the clients are created inside the app
+lifespan instead.
+
+`guild_placements` in the primary database overrides the ring for guilds
+that rebalance.py has moved, and marks guilds that are mid-move so writes to
+them are refused (with a retryable 503) until the copy is done. A replica
+that can't refresh placements for `stale_after` seconds refuses writes too:
+it can't tell whether a guild has moved away since.
+"""
+
+import asyncio
+import bisect
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from typing import Awaitable, Callable, Dict, List, Optional, TypeVar
+
+from motor.motor_asyncio import AsyncIOMotorClient
+
+from profiles import record_actions
+from storage import ModerationStorage
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Collections holding one guild's data, and the fields identifying a document in each
+GUILD_COLLECTIONS = {
+    "moderation_profiles": ("guild_id", "user_id"),
+    "guild_settings": ("guild_id",),
+    "ai_settings": ("guild_id", "channel_id"),
+}
+
+
+def _hash(key: str) -> int:
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent hash ring with virtual nodes"""
+
+    def __init__(self, nodes: List[str], vnodes: int = 128):
+        if not nodes:
+            raise ValueError("HashRing needs at least one node")
+        points = sorted((_hash(f"{node}#{i}"), node) for node in nodes for i in range(vnodes))
+        self._keys = [point for point, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def node_for(self, key: str) -> str:
+        index = bisect.bisect(self._keys, _hash(key)) % len(self._keys)
+        return self._nodes[index]
+
+
+class GuildMoving(Exception):
+    """Raised when writing to a guild that rebalance.py is currently moving"""
+
+    def __init__(self, guild_id: str):
+        super().__init__(f"Guild {guild_id} is being moved between partitions")
+        self.guild_id = guild_id
+
+
+class PlacementsStale(Exception):
+    """Raised when writing while guild placements haven't been refreshed recently"""
+
+    def __init__(self, age: Optional[float]):
+        super().__init__("Guild placements are out of date" if age is not None else "Guild placements not loaded yet")
+        self.age = age
+
+
+class Partition:
+    def __init__(self, name: str, client, db_name: str, default_storage_mode: str = "standard",
+                 url: Optional[str] = None):
+        self.name = name
+        self.url = url
+        self.db_name = db_name
+        self.default_storage_mode = default_storage_mode
+        self.listeners: list = []
+        self.client = self.db = self.storage = None
+        if client is not None:
+            self.attach(client)
+
+    def attach(self, client, listeners: Optional[list] = None):
+        self.client = client
+        self.listeners = listeners or []
+        self.db = client[self.db_name]
+        self.storage = ModerationStorage(self.db, self.default_storage_mode)
+
+
+class PartitionRouter:
+    def __init__(
+        self,
+        partitions: List[Partition],
+        listener_factory: Optional[Callable[[], list]] = None,
+        stale_after: Optional[float] = None,
+        clock=time.monotonic,
+    ):
+        if not partitions:
+            raise ValueError("At least one partition is required")
+        self.partitions = partitions
+        self.listener_factory = listener_factory
+        # None for one-off tools that refresh right before they write
+        self.stale_after = stale_after
+        self._clock = clock
+        self._refreshed_at: Optional[float] = None
+        self.by_name = {p.name: p for p in partitions}
+        self.ring = HashRing([p.name for p in partitions])
+        self._pinned: Dict[str, str] = {}
+        self._moving: set = set()
+
+    @classmethod
+    def from_env(
+        cls,
+        listener_factory: Optional[Callable[[], list]] = None,
+        lazy: bool = False,
+        stale_after: Optional[float] = None,
+    ) -> "PartitionRouter":
+        """Build partitions from MONGO_PARTITIONS (or MONGO_URL/DB_NAME)
+
+        `listener_factory` returns pymongo event listeners for one client;
+        each client gets its own so listeners know which cluster they watch.
+        """
+        raw = os.environ.get('MONGO_PARTITIONS')
+        if raw:
+            specs = json.loads(raw)
+        else:
+            specs = [{
+                "name": "default",
+                "url": os.environ.get('MONGO_URL', 'mongodb://localhost:27017'),
+                "db": os.environ.get('DB_NAME', 'discord_bot'),
+            }]
+        storage_mode = os.environ.get('MODERATION_STORAGE', 'standard')
+
+        router = cls(
+            [Partition(spec["name"], None, spec["db"], storage_mode, url=spec["url"]) for spec in specs],
+            listener_factory,
+            stale_after
+        )
+        if not lazy:
+            router.connect()
+        return router
+
+    @property
+    def connected(self) -> bool:
+        return all(p.client is not None for p in self.partitions)
+
+    def connect(self, io_loop=None):
+        """Create the Motor client of every partition that doesn't have one yet
+
+        Client construction can block on DNS (mongodb+srv), so async callers
+        should run this in an executor and pass their loop as `io_loop`.
+        """
+        for partition in self.partitions:
+            if partition.client is not None:
+                continue
+            listeners = self.listener_factory() if self.listener_factory else []
+            kwargs = {"io_loop": io_loop} if io_loop is not None else {}
+            client = AsyncIOMotorClient(partition.url, event_listeners=listeners, **kwargs)
+            for listener in listeners:
+                if hasattr(listener, "client"):
+                    listener.client = client
+            partition.attach(client, listeners)
+
+    @property
+    def primary(self) -> Partition:
+        return self.partitions[0]
+
+    def home_of(self, guild_id: str) -> Partition:
+        """Partition the ring assigns to a guild, ignoring placements"""
+        return self.by_name[self.ring.node_for(guild_id)]
+
+    def for_guild(self, guild_id: str, write: bool = False) -> Partition:
+        if write and self.stale_after is not None:
+            age = None if self._refreshed_at is None else self._clock() - self._refreshed_at
+            if age is None or age > self.stale_after:
+                raise PlacementsStale(age)
+        if write and guild_id in self._moving:
+            raise GuildMoving(guild_id)
+        name = self._pinned.get(guild_id)
+        if name is not None and name in self.by_name:
+            return self.by_name[name]
+        return self.home_of(guild_id)
+
+    async def refresh(self):
+        """Reload guild placements and each partition's storage layout
+
+        Placements come from the primary alone, so they count as fresh once
+        read; a partition whose layout can't be re-read keeps its last one and
+        doesn't hold up writes to guilds elsewhere.
+        """
+        started = self._clock()
+        pinned, moving = {}, set()
+        async for placement in self.primary.db.guild_placements.find({}, {"_id": 0}):
+            pinned[placement["guild_id"]] = placement["partition"]
+            if placement.get("moving_to"):
+                moving.add(placement["guild_id"])
+        self._pinned, self._moving = pinned, moving
+        # Placements are as fresh as the moment they were read
+        self._refreshed_at = started
+        results = await asyncio.gather(
+            *(p.storage.refresh() for p in self.partitions), return_exceptions=True
+        )
+        for partition, result in zip(self.partitions, results):
+            if isinstance(result, Exception):
+                logger.error(f"Storage layout refresh failed on partition {partition.name}: {result}")
+
+    async def fan_out(self, fn: Callable[[Partition], Awaitable[T]]) -> List[T]:
+        """Run `fn` on every partition concurrently"""
+        return await asyncio.gather(*(fn(p) for p in self.partitions))
+
+    def close(self):
+        for partition in self.partitions:
+            if partition.client is not None:
+                partition.client.close()
+
+
+class RoutedStore:
+    """Store-like facade writing each action to its guild's partition (for bulk imports)
+
+    Actions that are actually new are also applied to their users' profiles,
+    so an import keeps profiles current without recounting anything.
+    """
+
+    def __init__(self, router: PartitionRouter):
+        self.router = router
+
+    async def insert_batch(self, docs: List[Dict]) -> List[Dict]:
+        groups: Dict[str, List[Dict]] = defaultdict(list)
+        for doc in docs:
+            groups[self.router.for_guild(doc["guild_id"], write=True).name].append(doc)
+
+        async def write(part: Partition, group: List[Dict]) -> List[Dict]:
+            fresh = await part.storage.current.insert_batch(group)
+            await record_actions(part.db.moderation_profiles, fresh)
+            return fresh
+
+        results = await asyncio.gather(*(
+            write(self.router.by_name[name], group) for name, group in groups.items()
+        ))
+        return [doc for fresh in results for doc in fresh]
+
+    async def insert_many(self, docs: List[Dict]) -> int:
+        return len(await self.insert_batch(docs))
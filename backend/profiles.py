@@ -0,0 +1,157 @@
+"""
+Per-(guild, user) moderation profiles.
+
+A profile is a small document kept up to date on every synced action:
+
+    {guild_id, user_id, counts: {warn: 3, mute: 1, ...}, last_action: {...},
+     muted, muted_until, banned, updated_at}
+
+so viewing a user, or deciding whether to escalate, never has to re-count the
+user's history. Escalation thresholds live in BotSettings and are checked
+against the counters returned by the same update that bumped them.
+
+`muted_until` is None for a mute without a duration, so `muted` is what says
+whether the user is currently muted.
+
+Actions stored before profiles existed are folded in once with
+backfill_profiles.py, which sets each profile from its user's full history.
+Counters never go below zero when actions are deleted, so deleting an action
+that predates the backfill can't leave a negative count behind.
+"""
+
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+# Escalation ladder, most severe first: (settings field, action type)
+_ESCALATIONS = (
+    ("auto_ban_warnings", "ban"),
+    ("auto_kick_warnings", "kick"),
+    ("auto_mute_warnings", "mute"),
+)
+
+
+def _state_fields(action: Dict) -> Dict:
+    action_type = action["action_type"]
+    if action_type == "mute":
+        duration = action.get("duration")
+        until = action["timestamp"] + timedelta(minutes=duration) if duration else None
+        return {"muted": True, "muted_until": until}
+    if action_type == "unmute":
+        return {"muted": False, "muted_until": None}
+    if action_type == "ban":
+        return {"banned": True}
+    if action_type == "unban":
+        return {"banned": False}
+    return {}
+
+
+def _last_action(action: Dict) -> Dict:
+    return {k: action.get(k) for k in ("id", "action_type", "reason", "moderator_id", "timestamp")}
+
+
+def profile_update(action: Dict, count: int = 1) -> Dict:
+    """Update document applying `count` actions like `action` to its user's profile"""
+    return {
+        "$inc": {f"counts.{action['action_type']}": count},
+        "$set": {"last_action": _last_action(action), "updated_at": datetime.utcnow(), **_state_fields(action)},
+    }
+
+
+def history_update(groups: List[Dict]) -> Dict:
+    """Update document setting a profile from its user's whole history
+
+    `groups` has one {action_type, count, last} entry per action type the user
+    has, `last` being the newest action of that type.
+    """
+    def newest(types):
+        lasts = [g["last"] for g in groups if g["action_type"] in types]
+        return max(lasts, key=lambda a: a["timestamp"]) if lasts else None
+
+    state = {"muted": False, "muted_until": None, "banned": False}
+    for types in (("mute", "unmute"), ("ban", "unban")):
+        action = newest(types)
+        if action:
+            state.update(_state_fields(action))
+    return {"$set": {
+        "counts": {g["action_type"]: g["count"] for g in groups},
+        "last_action": _last_action(newest({g["action_type"] for g in groups})),
+        "updated_at": datetime.utcnow(),
+        **state,
+    }}
+
+
+async def record_action(profiles, action: Dict) -> Dict:
+    """Apply one action to its profile and return the updated profile"""
+    query = {"guild_id": action["guild_id"], "user_id": action["user_id"]}
+    update = profile_update(action)
+    try:
+        return await profiles.find_one_and_update(
+            query, update, upsert=True, return_document=ReturnDocument.AFTER, projection={"_id": 0}
+        )
+    except DuplicateKeyError:
+        # Two first-ever actions for this user raced on the upsert; the profile exists now
+        return await profiles.find_one_and_update(
+            query, update, return_document=ReturnDocument.AFTER, projection={"_id": 0}
+        )
+
+
+async def record_actions(profiles, actions: List[Dict]):
+    """Apply a batch of actions with one bulk_write: one update per (guild, user, action type)"""
+    groups: Dict[tuple, List[Dict]] = {}
+    for action in actions:
+        groups.setdefault((action["guild_id"], action["user_id"], action["action_type"]), []).append(action)
+    latest = sorted(
+        ((len(group), max(group, key=lambda a: a["timestamp"])) for group in groups.values()),
+        key=lambda item: item[1]["timestamp"]
+    )
+    # Applied oldest first, so last_action ends up as the user's newest action
+    requests = [
+        UpdateOne({"guild_id": last["guild_id"], "user_id": last["user_id"]}, profile_update(last, count), upsert=True)
+        for count, last in latest
+    ]
+    if requests:
+        # Ordered, so two updates for a brand-new user don't race on the upsert
+        await profiles.bulk_write(requests, ordered=True)
+
+
+async def retract_actions(profiles, guild_id: str, counts: Dict[str, Dict[str, int]]):
+    """Decrement counters for removed actions; `counts` is {user_id: {action_type: n}}
+
+    Counters stop at zero: an action recorded before its profile existed was
+    never counted, so removing it has nothing to take back.
+    """
+    requests = [
+        UpdateOne(
+            {"guild_id": guild_id, "user_id": user_id},
+            [{"$set": {
+                **{f"counts.{t}": {"$max": [0, {"$subtract": [{"$ifNull": [f"$counts.{t}", 0]}, n]}]}
+                   for t, n in per_type.items()},
+                "updated_at": datetime.utcnow(),
+            }}]
+        )
+        for user_id, per_type in counts.items() if per_type
+    ]
+    if requests:
+        await profiles.bulk_write(requests, ordered=False)
+
+
+def evaluate_escalation(settings: Optional[Dict], profile: Dict, action: Dict) -> Optional[Dict]:
+    """Escalation the bot should apply after `action`, if a threshold was just reached
+
+    Only fires on the warning that lands exactly on a threshold, so repeated
+    syncs past it don't keep re-escalating.
+    """
+    if not settings or action["action_type"] != "warn":
+        return None
+    warnings = profile.get("counts", {}).get("warn", 0)
+    for field, action_type in _ESCALATIONS:
+        threshold = settings.get(field)
+        if threshold and warnings == threshold:
+            escalation = {"action_type": action_type, "reason": f"{warnings} warnings reached"}
+            if action_type == "mute":
+                escalation["duration"] = settings.get("auto_mute_duration", 60)
+            return escalation
+    return None
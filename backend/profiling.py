@@ -0,0 +1,305 @@
+"""
+Opt-in request profiling and slow-query capture.
+
+Everything here is off unless configured:
+
+- PROFILE_SAMPLE_RATE: fraction of requests (0..1) run under a statistical
+  stack sampler. The sampler watches the event loop thread, so on a busy
+  replica a sampled request's profile also contains whatever else the loop
+  ran meanwhile; sample at a low rate and read it as "where the loop spent
+  its time while this request was in flight".
+- SLOW_REQUEST_MS: requests slower than this are logged with their span
+  breakdown and kept in a small ring buffer. Every Mongo command gets a span
+  automatically (see MongoSpanListener); other I/O, like Discord calls, is
+  wrapped in `span` by hand, and what is left is Python time.
+- SLOW_QUERY_MS: Mongo commands slower than this are logged together with
+  their `explain()` query plan.
+"""
+
+import asyncio
+import contextvars
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from pymongo import monitoring
+
+logger = logging.getLogger(__name__)
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("request_trace", default=None)
+
+# Commands whose plan explain() can show
+_EXPLAINABLE = {"find", "aggregate", "count", "distinct", "update", "delete", "findAndModify"}
+# Session/cluster fields that explain() rejects when the command is replayed
+_COMMAND_NOISE = {"lsid", "$db", "$clusterTime", "$readPreference", "txnNumber", "signature"}
+
+
+class RequestTrace:
+    def __init__(self, method: str, path: str, sampled: bool):
+        self.method = method
+        self.path = path
+        self.sampled = sampled
+        self.started_at = datetime.utcnow()
+        self.started = time.perf_counter()
+        self.spans: List[Dict] = []
+        self.samples: Counter = Counter()
+
+    def dict(self, duration_ms: float, status: Optional[int], top_frames: int = 15) -> Dict:
+        accounted = sum(s["ms"] for s in self.spans)
+        return {
+            "method": self.method,
+            "path": self.path,
+            "status": status,
+            "started_at": self.started_at,
+            "duration_ms": round(duration_ms, 2),
+            "spans": self.spans,
+            "unaccounted_ms": round(max(0.0, duration_ms - accounted), 2),
+            "profile": [
+                {"frame": frame, "samples": count}
+                for frame, count in self.samples.most_common(top_frames)
+            ],
+        }
+
+
+@contextmanager
+def span(name: str):
+    """Time a block and attach it to the current request's breakdown, if any"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.spans.append({"name": name, "ms": round((time.perf_counter() - started) * 1000, 2)})
+
+
+class StackSampler:
+    """Background thread sampling the event loop thread's stack while traces are active"""
+
+    def __init__(self, interval: float = 0.005, depth: int = 3):
+        self.interval = interval
+        self.depth = depth
+        self._traces: List[RequestTrace] = []
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._target: Optional[int] = None
+
+    def attach(self, trace: RequestTrace):
+        with self._lock:
+            self._target = threading.get_ident()
+            self._traces.append(trace)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+                self._thread.start()
+
+    def detach(self, trace: RequestTrace):
+        with self._lock:
+            self._traces.remove(trace)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._traces:
+                    self._thread = None
+                    return
+                traces = list(self._traces)
+                target = self._target
+            frame = sys._current_frames().get(target)
+            if frame is None:
+                continue
+            key = self._frame_key(frame)
+            # Under the lock, so a detached trace's samples are final and safe to read
+            with self._lock:
+                for trace in traces:
+                    if trace in self._traces:
+                        trace.samples[key] += 1
+
+    def _frame_key(self, frame) -> str:
+        parts = []
+        while frame is not None and len(parts) < self.depth:
+            code = frame.f_code
+            parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+            frame = frame.f_back
+        return " < ".join(parts)
+
+
+class MongoSpanListener(monitoring.CommandListener):
+    """pymongo listener adding a span for each Mongo command of a traced request
+
+    Motor runs pymongo on executor threads with a copy of the caller's
+    context, so the request's trace is visible from the callbacks.
+    """
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._record(event)
+
+    def failed(self, event):
+        self._record(event)
+
+    def _record(self, event):
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.spans.append({"name": f"mongo.{event.command_name}", "ms": round(event.duration_micros / 1000, 2)})
+
+
+class SlowQueryListener(monitoring.CommandListener):
+    """pymongo listener that explains commands slower than the threshold
+
+    Listener callbacks run on Motor's executor threads, so the explain is
+    scheduled back onto the event loop instead of blocking a pool worker.
+    Each Motor client gets its own listener; `client` is set once the client
+    exists so the explain runs against the cluster that was slow.
+    """
+
+    def __init__(self, profiler: "RequestProfiler"):
+        self.profiler = profiler
+        self.client = None
+        self._pending: Dict = {}
+
+    def started(self, event):
+        if event.command_name in _EXPLAINABLE:
+            command = {k: v for k, v in event.command.items() if k not in _COMMAND_NOISE}
+            self._pending[(event.connection_id, event.request_id)] = (event.database_name, command)
+
+    def succeeded(self, event):
+        pending = self._pending.pop((event.connection_id, event.request_id), None)
+        duration_ms = event.duration_micros / 1000
+        if pending and duration_ms >= self.profiler.slow_query_ms:
+            self.profiler.record_slow_query(self.client, pending[0], event.command_name, pending[1], duration_ms)
+
+    def failed(self, event):
+        self._pending.pop((event.connection_id, event.request_id), None)
+
+
+class RequestProfiler:
+    def __init__(
+        self,
+        sample_rate: float = 0.0,
+        slow_request_ms: float = 0.0,
+        slow_query_ms: float = 0.0,
+        max_entries: int = 100,
+        sample_interval: float = 0.005,
+    ):
+        self.sample_rate = sample_rate
+        self.slow_request_ms = slow_request_ms
+        self.slow_query_ms = slow_query_ms
+        self.slow_requests: deque = deque(maxlen=max_entries)
+        self.slow_queries: deque = deque(maxlen=max_entries)
+        self.sampler = StackSampler(sample_interval)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @classmethod
+    def from_env(cls) -> "RequestProfiler":
+        return cls(
+            sample_rate=float(os.environ.get('PROFILE_SAMPLE_RATE', '0')),
+            slow_request_ms=float(os.environ.get('SLOW_REQUEST_MS', '0')),
+            slow_query_ms=float(os.environ.get('SLOW_QUERY_MS', '0')),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0 or self.slow_request_ms > 0
+
+    def event_listeners(self) -> list:
+        """Listeners for one new Mongo client; empty unless profiling or slow-query capture is on"""
+        listeners = []
+        if self.enabled:
+            listeners.append(MongoSpanListener())
+        if self.slow_query_ms > 0:
+            listeners.append(SlowQueryListener(self))
+        return listeners
+
+    def bind(self, loop: asyncio.AbstractEventLoop):
+        """Give the profiler the event loop to run explain() on"""
+        self._loop = loop
+
+    def record_slow_query(self, client, database: str, command_name: str, command: Dict, duration_ms: float):
+        entry = {
+            "recorded_at": datetime.utcnow(),
+            "database": database,
+            "command": command_name,
+            "duration_ms": round(duration_ms, 2),
+            "filter": command.get("filter") or command.get("query") or command.get("pipeline"),
+            "explain": None,
+        }
+        self.slow_queries.append(entry)
+        logger.warning(f"Slow Mongo {command_name} on {database} ({duration_ms:.1f} ms): {entry['filter']}")
+        if client is not None and self._loop is not None and not self._loop.is_closed():
+            asyncio.run_coroutine_threadsafe(self._explain(client, entry, database, command), self._loop)
+
+    async def _explain(self, client, entry: Dict, database: str, command: Dict):
+        try:
+            result = await client[database].command(
+                {"explain": command, "verbosity": "queryPlanner"}
+            )
+            entry["explain"] = result.get("queryPlanner", result)
+            logger.warning(f"Plan for slow {entry['command']}: {entry['explain'].get('winningPlan')}")
+        except Exception as e:
+            entry["explain"] = {"error": str(e)}
+
+    def start(self, method: str, path: str) -> Optional[RequestTrace]:
+        if not self.enabled:
+            return None
+        sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+        trace = RequestTrace(method, path, sampled)
+        if sampled:
+            self.sampler.attach(trace)
+        return trace
+
+    def finish(self, trace: RequestTrace, status: Optional[int]):
+        if trace.sampled:
+            self.sampler.detach(trace)
+        duration_ms = (time.perf_counter() - trace.started) * 1000
+        slow = self.slow_request_ms > 0 and duration_ms >= self.slow_request_ms
+        if slow or trace.sampled:
+            entry = trace.dict(duration_ms, status)
+            entry["slow"] = slow
+            self.slow_requests.append(entry)
+            if slow:
+                breakdown = ", ".join(f"{s['name']}={s['ms']}ms" for s in trace.spans) or "no spans"
+                logger.warning(f"Slow request {trace.method} {trace.path} ({duration_ms:.1f} ms): {breakdown}")
+
+
+class ProfilingMiddleware:
+    """Pure ASGI middleware installing a RequestTrace for each profiled request"""
+
+    def __init__(self, app, profiler: RequestProfiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        trace = self.profiler.start(scope["method"], scope["path"])
+        if trace is None:
+            await self.app(scope, receive, send)
+            return
+
+        status = None
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        token = _current_trace.set(trace)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_trace.reset(token)
+            self.profiler.finish(trace, status)
@@ -0,0 +1,159 @@
+"""
+Readiness tracking for the API.
+
+/api/health only says the process is alive. /api/ready says whether this
+replica should take traffic: its dependencies were initialized in the app
+lifespan, Mongo pools were pre-warmed, and each dependency currently answers a
+ping. It also reports ping latency and how saturated each Mongo pool is, so an
+autoscaler (or a human) can tell a cold replica from an overloaded one.
+
+Until guild placements and storage layouts have been loaded, StartupGate
+answers every other route with a 503: serving before that would read and
+write the wrong partition or collection.
+"""
+
+import asyncio
+import json
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+from pymongo import monitoring
+
+
+class PoolStats(monitoring.ConnectionPoolListener):
+    """Connection counts for one Mongo client, from pymongo pool events"""
+
+    def __init__(self):
+        self.open = 0
+        self.in_use = 0
+        self.check_out_failures = 0
+
+    def connection_created(self, event):
+        self.open += 1
+
+    def connection_closed(self, event):
+        self.open = max(0, self.open - 1)
+
+    def connection_checked_out(self, event):
+        self.in_use += 1
+
+    def connection_checked_in(self, event):
+        self.in_use = max(0, self.in_use - 1)
+
+    def connection_check_out_failed(self, event):
+        self.check_out_failures += 1
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def dict(self, max_pool_size: int) -> Dict:
+        return {
+            "open": self.open,
+            "in_use": self.in_use,
+            "max": max_pool_size,
+            "saturation": round(self.in_use / max_pool_size, 3) if max_pool_size else None,
+            "check_out_failures": self.check_out_failures,
+        }
+
+
+async def ping(check: Callable[[], Awaitable], timeout: float) -> Dict:
+    """Run one dependency check, reporting success and latency"""
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(check(), timeout)
+        return {"ok": True, "latency_ms": round((time.perf_counter() - started) * 1000, 2)}
+    except Exception as e:
+        return {
+            "ok": False,
+            "latency_ms": round((time.perf_counter() - started) * 1000, 2),
+            "error": str(e) or type(e).__name__,
+        }
+
+
+class CachedCheck:
+    """A dependency ping whose result is reused for `ttl` seconds
+
+    For dependencies that are reported but don't gate readiness, so frequent
+    probes from many replicas don't spend the dependency's rate limit.
+    """
+
+    def __init__(self, check: Callable[[], Awaitable], timeout: float, ttl: float, clock=time.monotonic):
+        self.check = check
+        self.timeout = timeout
+        self.ttl = ttl
+        self._clock = clock
+        self._result: Optional[Dict] = None
+        self._checked_at = 0.0
+
+    async def __call__(self) -> Dict:
+        if self._result is None or self._clock() - self._checked_at >= self.ttl:
+            self._result = await ping(self.check, self.timeout)
+            self._checked_at = self._clock()
+        return {**self._result, "age_s": round(self._clock() - self._checked_at, 1)}
+
+
+async def prewarm_mongo(client, connections: int):
+    """Open up to `connections` pooled connections by pinging concurrently"""
+    await asyncio.gather(*(client.admin.command("ping") for _ in range(max(1, connections))))
+
+
+class Readiness:
+    """Startup progress of this replica"""
+
+    def __init__(self, import_started: float):
+        self.import_started = import_started
+        self.ready_after: Optional[float] = None
+        # Placements and storage layouts loaded, indexes in place
+        self.serving = False
+        # ...and pools pre-warmed
+        self.initialized = False
+        self.last_error: Optional[str] = None
+
+    def mark_serving(self):
+        self.serving = True
+
+    def mark_ready(self) -> float:
+        self.initialized = True
+        self.ready_after = time.perf_counter() - self.import_started
+        return self.ready_after
+
+
+class StartupGate:
+    """Pure ASGI middleware answering 503 until the replica can route requests"""
+
+    def __init__(self, app, readiness: Readiness, exempt_paths=("/", "/api/health", "/api/ready"), retry_after: int = 5):
+        self.app = app
+        self.readiness = readiness
+        self.exempt_paths = set(exempt_paths)
+        self.retry_after = retry_after
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.readiness.serving or scope["path"] in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+        body = json.dumps({"detail": "Starting up, try again shortly"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(self.retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
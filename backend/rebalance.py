@@ -0,0 +1,183 @@
+"""
+Move guilds between partitions (see partitioning.py).
+
+Adding a partition to MONGO_PARTITIONS changes which partition the hash ring
+assigns to roughly 1/N of the guilds, but their data is still where it was.
+The safe sequence is:
+
+1. `python rebalance.py --pin` with the *new* MONGO_PARTITIONS, before the API
+   is deployed with it: every guild whose data is not on its ring partition
+   gets a placement pinning it to where the data actually is;
+2. deploy the API with the new MONGO_PARTITIONS;
+3. `python rebalance.py --pin` again once every replica runs the new
+   configuration: while old-ring and new-ring replicas coexist, a guild
+   first written during the rollout can land on its old-ring partition;
+4. `python rebalance.py --rebalance` (or `--guild ID --to NAME`) to move the
+   pinned guilds home one at a time.
+
+Moving a guild: mark it as moving (replicas then answer writes to it with a
+retryable 503), wait for replicas to notice, copy its actions, profiles and
+settings, flip the placement, wait again so readers follow, and only then
+delete the source copy.
+
+Usage:
+    python rebalance.py --plan
+    python rebalance.py --pin
+    python rebalance.py --rebalance
+    python rebalance.py --guild 123456789012345678 --to p1
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+from pathlib import Path
+from typing import Dict, List
+
+from pymongo import ReplaceOne
+
+from partitioning import GUILD_COLLECTIONS, Partition, PartitionRouter
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+
+async def guilds_by_partition(router: PartitionRouter) -> Dict[str, List[str]]:
+    """Guild ids that have data in each partition"""
+    async def scan(part: Partition) -> List[str]:
+        guilds = set(await part.storage.actions.distinct("guild_id"))
+        for name in GUILD_COLLECTIONS:
+            guilds.update(await part.db[name].distinct("guild_id"))
+        return sorted(guilds)
+
+    found = await router.fan_out(scan)
+    return {part.name: guilds for part, guilds in zip(router.partitions, found)}
+
+
+async def plan(router: PartitionRouter) -> List[Dict]:
+    """Guilds whose data is not on their ring partition"""
+    misplaced = []
+    for name, guilds in (await guilds_by_partition(router)).items():
+        for guild_id in guilds:
+            home = router.home_of(guild_id).name
+            if home != name:
+                misplaced.append({"guild_id": guild_id, "data_in": name, "home": home})
+    return misplaced
+
+
+async def pin(router: PartitionRouter):
+    for entry in await plan(router):
+        await router.primary.db.guild_placements.update_one(
+            {"guild_id": entry["guild_id"]},
+            {"$set": {"guild_id": entry["guild_id"], "partition": entry["data_in"]}},
+            upsert=True
+        )
+        logger.info(f"Pinned guild {entry['guild_id']} to {entry['data_in']} (home: {entry['home']})")
+
+
+async def _copy_actions(source: Partition, target: Partition, guild_id: str) -> int:
+    copied = 0
+    batch = []
+    async for doc in source.storage.actions.find({"guild_id": guild_id}).batch_size(BATCH_SIZE):
+        # Every copied action claims a key so an interrupted move can simply be rerun
+        doc["idempotency_key"] = doc.get("idempotency_key") or f"moved:{doc['id']}"
+        batch.append(doc)
+        if len(batch) >= BATCH_SIZE:
+            await target.storage.current.insert_many(batch)
+            copied += len(batch)
+            batch = []
+    if batch:
+        await target.storage.current.insert_many(batch)
+        copied += len(batch)
+    return copied
+
+
+async def _copy_collection(source: Partition, target: Partition, name: str, guild_id: str) -> int:
+    keys = GUILD_COLLECTIONS[name]
+    requests = []
+    async for doc in source.db[name].find({"guild_id": guild_id}, {"_id": 0}):
+        requests.append(ReplaceOne({k: doc.get(k) for k in keys}, doc, upsert=True))
+    if requests:
+        await target.db[name].bulk_write(requests, ordered=False)
+    return len(requests)
+
+
+async def move_guild(router: PartitionRouter, guild_id: str, target_name: str, refresh_seconds: float):
+    await router.refresh()
+    source = router.for_guild(guild_id)
+    target = router.by_name[target_name]
+    if source is target:
+        logger.info(f"Guild {guild_id} is already on {target_name}")
+        return
+
+    placements = router.primary.db.guild_placements
+    await placements.update_one(
+        {"guild_id": guild_id},
+        {"$set": {"guild_id": guild_id, "partition": source.name, "moving_to": target.name}},
+        upsert=True
+    )
+    logger.info(f"Guild {guild_id}: holding writes, waiting for replicas")
+    await asyncio.sleep(refresh_seconds * 2)
+
+    await target.storage.current.ensure_indexes()
+    actions = await _copy_actions(source, target, guild_id)
+    others = {name: await _copy_collection(source, target, name, guild_id) for name in GUILD_COLLECTIONS}
+    logger.info(f"Guild {guild_id}: copied {actions} actions, {others} to {target.name}")
+
+    if router.home_of(guild_id) is target:
+        await placements.delete_one({"guild_id": guild_id})
+    else:
+        await placements.update_one(
+            {"guild_id": guild_id}, {"$set": {"partition": target.name}, "$unset": {"moving_to": ""}}
+        )
+    # Let every replica read from the target before the source copy disappears
+    await asyncio.sleep(refresh_seconds * 2)
+
+    await source.storage.actions.delete_many({"guild_id": guild_id})
+    await source.db.moderation_sync_keys.delete_many({"guild_id": guild_id})
+    for name in GUILD_COLLECTIONS:
+        await source.db[name].delete_many({"guild_id": guild_id})
+    logger.info(f"Guild {guild_id}: moved from {source.name} to {target.name}")
+
+
+def main():
+    from dotenv import load_dotenv
+
+    load_dotenv(Path(__file__).parent / '.env')
+    parser = argparse.ArgumentParser(description="Move guilds between Mongo partitions")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--plan", action="store_true", help="list guilds whose data is off their ring partition")
+    group.add_argument("--pin", action="store_true", help="pin misplaced guilds to where their data is")
+    group.add_argument("--rebalance", action="store_true", help="move every misplaced guild home")
+    group.add_argument("--guild", help="guild id to move (with --to)")
+    parser.add_argument("--to", help="target partition name")
+    args = parser.parse_args()
+    if args.guild and not args.to:
+        parser.error("--guild needs --to")
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    router = PartitionRouter.from_env()
+    refresh_seconds = float(os.environ.get('STORAGE_REFRESH_SECONDS', '30'))
+
+    async def run():
+        await router.refresh()
+        if args.plan:
+            for entry in await plan(router):
+                print(f"{entry['guild_id']}: data in {entry['data_in']}, home {entry['home']}")
+        elif args.pin:
+            await pin(router)
+        elif args.rebalance:
+            for entry in await plan(router):
+                await move_guild(router, entry["guild_id"], entry["home"], refresh_seconds)
+        else:
+            await move_guild(router, args.guild, args.to, refresh_seconds)
+
+    try:
+        asyncio.run(run())
+    finally:
+        router.close()
+
+
+if __name__ == "__main__":
+    main()
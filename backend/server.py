@@ -1,20 +1,38 @@
-from fastapi import FastAPI, APIRouter, Depends, HTTPException, Request
-from fastapi.responses import RedirectResponse
+import time
+
+# Start of the import-to-ready measurement reported by /api/ready
+IMPORT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, APIRouter, Depends, HTTPException, Request, Header
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, RedirectResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Literal
 import uuid
 from datetime import datetime, timedelta
 import jwt
 import aiohttp
 import json
+from collections import Counter
 from fastapi_discord import DiscordOAuthClient, User
+from admission import AdmissionController, AdmissionMiddleware
+from dedupe import DedupeWindow
+from croxydb_import import ImportProgress, import_croxydb
+from profiles import evaluate_escalation, record_action, retract_actions
+from profiling import ProfilingMiddleware, RequestProfiler, span
+from storage import count_actions
+from partitioning import GuildMoving, PartitionRouter, PlacementsStale, RoutedStore
+from bulk import build_filter, delete_matching, record_many, revert_filter
+from readiness import CachedCheck, PoolStats, Readiness, StartupGate, ping, prewarm_mongo
+from contextlib import asynccontextmanager
+import functools
+import asyncio
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -28,21 +46,68 @@ DISCORD_REDIRECT_URI = os.environ.get('DISCORD_REDIRECT_URI')
 OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY', '')
 BOT_OWNER_ID = os.environ.get('BOT_OWNER_ID', '510769103024291840')
 JWT_SECRET = os.environ.get('JWT_SECRET', 'your-secret-key-here')
+# Shared secret the Discord bot sends as X-Bot-Key; bot routes only get priority with it
+BOT_API_KEY = os.environ.get('BOT_API_KEY', '')
+
+# Opt-in request profiling / slow-query capture (see profiling.py)
+profiler = RequestProfiler.from_env()
+
+# How often placements and the moderation action layout (standard or
+# time-series, switchable by migrate_timeseries.py) are re-read
+STORAGE_REFRESH_SECONDS = float(os.environ.get('STORAGE_REFRESH_SECONDS', '30'))
+
+# MongoDB connection, one client per partition (see partitioning.py); guild data
+# lives in partitions.for_guild(guild_id), global data (users) in the primary.
+# Clients are created in the app lifespan, not at import. Writes are refused
+# once placements haven't been refreshed for two intervals
+partitions = PartitionRouter.from_env(
+    lambda: profiler.event_listeners() + [PoolStats()],
+    lazy=True,
+    stale_after=STORAGE_REFRESH_SECONDS * 2
+)
 
-# MongoDB connection
-client = AsyncIOMotorClient(MONGO_URL)
-db = client[DB_NAME]
+# Pooled connections opened per partition before the replica reports ready
+MONGO_PREWARM_CONNECTIONS = int(os.environ.get('MONGO_PREWARM_CONNECTIONS', '10'))
+# Timeout of each dependency ping made by /api/ready
+READY_PING_TIMEOUT = float(os.environ.get('READY_PING_TIMEOUT', '2'))
+# How long /api/ready reuses its Discord ping, to stay clear of Discord's rate limits
+DISCORD_PING_TTL = float(os.environ.get('DISCORD_PING_TTL', '60'))
+
+DISCORD_API = "https://discord.com/api"
+
+# Discord OAuth2 client and the HTTP session shared by all Discord calls,
+# both created in the app lifespan
+discord: Optional[DiscordOAuthClient] = None
+http_session: Optional[aiohttp.ClientSession] = None
+
+readiness = Readiness(IMPORT_STARTED)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global discord, http_session
+    profiler.bind(asyncio.get_running_loop())
+
+    http_session = aiohttp.ClientSession()
+    discord = DiscordOAuthClient(
+        DISCORD_CLIENT_ID,
+        DISCORD_CLIENT_SECRET,
+        DISCORD_REDIRECT_URI,
+        scopes=("identify", "guilds")
+    )
+    discord.client_session = http_session
 
-# Discord OAuth2 client
-discord = DiscordOAuthClient(
-    DISCORD_CLIENT_ID,
-    DISCORD_CLIENT_SECRET,
-    DISCORD_REDIRECT_URI,
-    scopes=("identify", "guilds")
-)
+    # Serve /api/health right away; other routes wait for placements (StartupGate),
+    # and /api/ready turns 200 once pools are warm
+    init_task = asyncio.create_task(initialize())
+    try:
+        yield
+    finally:
+        init_task.cancel()
+        await http_session.close()
+        partitions.close()
 
 # Create the main app
-app = FastAPI(title="Discord Bot Dashboard API", version="1.0.0")
+app = FastAPI(title="Discord Bot Dashboard API", version="1.0.0", lifespan=lifespan)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -50,6 +115,18 @@ api_router = APIRouter(prefix="/api")
 # Security
 security = HTTPBearer()
 
+# Upper bound on actions recorded by one bulk request
+BULK_MAX_ACTIONS = int(os.environ.get('BULK_MAX_ACTIONS', '5000'))
+
+# Admission control (per-guild/per-route limits, load shedding)
+admission = AdmissionController.from_env()
+
+# Recently synced (guild_id, idempotency_key) pairs, so hot bot retries skip Mongo
+sync_dedupe = DedupeWindow(ttl=float(os.environ.get('SYNC_DEDUPE_TTL', '300')))
+
+# Process-local counters, exposed on /api/metrics
+metrics = Counter()
+
 # Models
 class UserInfo(BaseModel):
     id: str
@@ -65,15 +142,19 @@ class Guild(BaseModel):
     owner: bool = False
     permissions: str
 
+# Moderation action types; also used as profile counter names
+ActionType = Literal["warn", "mute", "kick", "ban", "unmute", "unban"]
+
 class ModerationAction(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     guild_id: str
     user_id: str
-    action_type: str  # warn, ban, kick, mute
+    action_type: ActionType
     reason: str
     moderator_id: str
     timestamp: datetime = Field(default_factory=datetime.utcnow)
     duration: Optional[int] = None  # for mutes, in minutes
+    idempotency_key: Optional[str] = None  # set by the bot so retries don't duplicate
 
 class BotSettings(BaseModel):
     guild_id: str
@@ -87,6 +168,35 @@ class BotSettings(BaseModel):
     anti_link: bool = True
     ai_enabled: bool = True
     ai_channels: List[str] = []
+    # Escalation thresholds, in warnings; None disables that step
+    auto_mute_warnings: Optional[int] = None
+    auto_mute_duration: int = 60  # minutes
+    auto_kick_warnings: Optional[int] = None
+    auto_ban_warnings: Optional[int] = None
+
+class BulkActionItem(BaseModel):
+    user_id: str
+    action_type: ActionType
+    reason: str
+    duration: Optional[int] = None  # for mutes, in minutes
+    idempotency_key: Optional[str] = None
+
+class BulkActionsRequest(BaseModel):
+    actions: List[BulkActionItem]
+
+class BulkDeleteRequest(BaseModel):
+    moderator_id: Optional[str] = None
+    user_ids: Optional[List[str]] = None
+    action_types: Optional[List[ActionType]] = None
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
+    dry_run: bool = False
+    revert: bool = False  # also record unban/unmute for reverted bans/mutes
+
+class CroxydbImportRequest(BaseModel):
+    path: str  # croxydb JSON file, on the API server's filesystem
+    batch_size: int = 1000
+    resume: bool = False  # continue an interrupted import of the same, unchanged file
 
 class BotStats(BaseModel):
     guild_count: int
@@ -106,6 +216,14 @@ def create_jwt_token(user_data: dict) -> str:
     }
     return jwt.encode(payload, JWT_SECRET, algorithm="HS256")
 
+def has_valid_jwt(token: str) -> bool:
+    """Signature/expiry check only, cheap enough for admission control"""
+    try:
+        jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
+        return True
+    except jwt.InvalidTokenError:
+        return False
+
 async def verify_jwt_token(token: str) -> dict:
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
@@ -118,7 +236,7 @@ async def verify_jwt_token(token: str) -> dict:
 async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     token = credentials.credentials
     payload = await verify_jwt_token(token)
-    user_data = await db.users.find_one({"id": payload["user_id"]})
+    user_data = await partitions.primary.db.users.find_one({"id": payload["user_id"]})
     if not user_data:
         raise HTTPException(status_code=401, detail="User not found")
     return user_data
@@ -126,8 +244,8 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
 async def get_discord_user_guilds(access_token: str) -> List[Dict]:
     """Get user's Discord guilds using their access token"""
     headers = {"Authorization": f"Bearer {access_token}"}
-    async with aiohttp.ClientSession() as session:
-        async with session.get("https://discord.com/api/users/@me/guilds", headers=headers) as response:
+    with span("discord.user_guilds"):
+        async with http_session.get(f"{DISCORD_API}/users/@me/guilds", headers=headers) as response:
             if response.status == 200:
                 return await response.json()
             return []
@@ -169,7 +287,7 @@ async def discord_callback(code: str):
             "last_login": datetime.utcnow()
         }
         
-        await db.users.update_one(
+        await partitions.primary.db.users.update_one(
             {"id": user_data.id},
             {"$set": user_doc},
             upsert=True
@@ -229,7 +347,8 @@ async def get_guild_settings(guild_id: str, current_user: dict = Depends(get_cur
     if not await is_user_admin_in_guild(guild_id, current_user["id"]):
         raise HTTPException(status_code=403, detail="Access denied")
     
-    settings = await db.guild_settings.find_one({"guild_id": guild_id})
+    part = partitions.for_guild(guild_id)
+    settings = await part.db.guild_settings.find_one({"guild_id": guild_id})
     if not settings:
         # Return default settings
         default_settings = BotSettings(guild_id=guild_id)
@@ -252,7 +371,8 @@ async def update_guild_settings(
     settings_dict["updated_at"] = datetime.utcnow()
     settings_dict["updated_by"] = current_user["id"]
     
-    await db.guild_settings.update_one(
+    part = partitions.for_guild(guild_id, write=True)
+    await part.db.guild_settings.update_one(
         {"guild_id": guild_id},
         {"$set": settings_dict},
         upsert=True
@@ -273,7 +393,8 @@ async def get_moderation_actions(
     if not await is_user_admin_in_guild(guild_id, current_user["id"]):
         raise HTTPException(status_code=403, detail="Access denied")
     
-    actions = await db.moderation_actions.find(
+    part = partitions.for_guild(guild_id)
+    actions = await part.storage.actions.find(
         {"guild_id": guild_id}
     ).sort("timestamp", -1).skip(offset).limit(limit).to_list(limit)
     
@@ -283,6 +404,7 @@ async def get_moderation_actions(
 async def get_user_warnings(
     guild_id: str,
     user_id: str,
+    limit: int = 100,
     current_user: dict = Depends(get_current_user)
 ):
     """Get warnings for a specific user in a guild"""
@@ -290,14 +412,62 @@ async def get_user_warnings(
     if not await is_user_admin_in_guild(guild_id, current_user["id"]):
         raise HTTPException(status_code=403, detail="Access denied")
     
-    warnings = await db.moderation_actions.find({
+    part = partitions.for_guild(guild_id)
+    warnings = await part.storage.actions.find({
         "guild_id": guild_id,
         "user_id": user_id,
         "action_type": "warn"
-    }).sort("timestamp", -1).to_list(100)
+    }).sort("timestamp", -1).to_list(limit)
     
     return {"warnings": warnings}
 
+@api_router.get("/guilds/{guild_id}/moderation/users/{user_id}/profile")
+async def get_user_profile(
+    guild_id: str,
+    user_id: str,
+    current_user: dict = Depends(get_current_user)
+):
+    """Get a user's moderation counters, last action and mute/ban state"""
+    # Verify user has admin in guild
+    if not await is_user_admin_in_guild(guild_id, current_user["id"]):
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    part = partitions.for_guild(guild_id)
+    profile = await part.db.moderation_profiles.find_one(
+        {"guild_id": guild_id, "user_id": user_id},
+        {"_id": 0}
+    )
+    return profile or {"guild_id": guild_id, "user_id": user_id, "counts": {}}
+
+@api_router.get("/guilds/{guild_id}/moderation/export")
+async def export_moderation_actions(
+    guild_id: str,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """Export a guild's moderation actions in a time range as JSON lines"""
+    # Verify user has admin in guild
+    if not await is_user_admin_in_guild(guild_id, current_user["id"]):
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    query: Dict[str, Any] = {"guild_id": guild_id}
+    if since or until:
+        query["timestamp"] = {}
+        if since:
+            query["timestamp"]["$gte"] = since
+        if until:
+            query["timestamp"]["$lt"] = until
+    
+    part = partitions.for_guild(guild_id)
+    cursor = part.storage.actions.find(query, {"_id": 0}).sort("timestamp", 1).batch_size(1000)
+    
+    async def lines():
+        async for action in cursor:
+            yield json.dumps(action, default=str) + "\n"
+    
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
 @api_router.delete("/guilds/{guild_id}/moderation/actions/{action_id}")
 async def delete_moderation_action(
     guild_id: str,
@@ -309,16 +479,116 @@ async def delete_moderation_action(
     if not await is_user_admin_in_guild(guild_id, current_user["id"]):
         raise HTTPException(status_code=403, detail="Access denied")
     
-    result = await db.moderation_actions.delete_one({
+    part = partitions.for_guild(guild_id, write=True)
+    action = await part.storage.current.delete_one({
         "id": action_id,
         "guild_id": guild_id
     })
     
-    if result.deleted_count == 0:
+    if action is None:
         raise HTTPException(status_code=404, detail="Action not found")
     
+    await retract_actions(part.db.moderation_profiles, guild_id, {action["user_id"]: {action["action_type"]: 1}})
+    
     return {"message": "Action deleted successfully"}
 
+@api_router.post("/guilds/{guild_id}/moderation/actions/bulk")
+async def bulk_record_moderation_actions(
+    guild_id: str,
+    request: BulkActionsRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """Record many moderation actions at once, streaming progress as JSON lines"""
+    # Verify user has admin in guild
+    if not await is_user_admin_in_guild(guild_id, current_user["id"]):
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    if len(request.actions) > BULK_MAX_ACTIONS:
+        raise HTTPException(status_code=400, detail=f"At most {BULK_MAX_ACTIONS} actions per request")
+    
+    part = partitions.for_guild(guild_id, write=True)
+    now = datetime.utcnow()
+    docs = []
+    # Only keys a client chose can come back as retries worth remembering
+    caller_keys = {item.idempotency_key for item in request.actions if item.idempotency_key}
+    for item in request.actions:
+        action = ModerationAction(
+            guild_id=guild_id,
+            user_id=item.user_id,
+            action_type=item.action_type,
+            reason=item.reason,
+            moderator_id=current_user["id"],
+            timestamp=now,
+            duration=item.duration,
+            idempotency_key=item.idempotency_key
+        )
+        # Stores write batches idempotently, so every bulk row needs a key
+        action.idempotency_key = action.idempotency_key or f"bulk:{action.id}"
+        docs.append(action.dict())
+    
+    async def progress():
+        last = {"processed": 0, "total": len(docs), "inserted": 0}
+        try:
+            async for step in record_many(part, docs):
+                fresh = step.pop("new")
+                for doc in fresh:
+                    if doc["idempotency_key"] in caller_keys:
+                        sync_dedupe.add((guild_id, doc["idempotency_key"]))
+                metrics["bulk_inserted"] += len(fresh)
+                last = step
+                yield json.dumps(step) + "\n"
+        except Exception as e:
+            # The 200 is already sent; report how far it got so the retry can be judged
+            logging.error(f"Bulk record error in guild {guild_id}: {e}")
+            yield json.dumps({**last, "error": str(e)}) + "\n"
+    
+    return StreamingResponse(progress(), media_type="application/x-ndjson")
+
+@api_router.post("/guilds/{guild_id}/moderation/actions/bulk-delete")
+async def bulk_delete_moderation_actions(
+    guild_id: str,
+    request: BulkDeleteRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """Delete or revert every moderation action matching a filter"""
+    # Verify user has admin in guild
+    if not await is_user_admin_in_guild(guild_id, current_user["id"]):
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    if not (request.moderator_id or request.user_ids or request.action_types or request.since or request.until):
+        raise HTTPException(status_code=400, detail="At least one filter is required")
+    
+    query = build_filter(
+        guild_id,
+        moderator_id=request.moderator_id,
+        user_ids=request.user_ids,
+        action_types=request.action_types,
+        since=request.since,
+        until=request.until
+    )
+    
+    if request.dry_run:
+        part = partitions.for_guild(guild_id)
+        # Count what would actually be acted on
+        counts = await count_actions(part.storage.actions, revert_filter(query) if request.revert else query)
+        return {"matched": sum(counts.values()), "by_type": counts}
+    
+    part = partitions.for_guild(guild_id, write=True)
+    
+    async def progress():
+        last = {"processed": 0, "deleted": 0}
+        try:
+            async for step in delete_matching(part, query, revert=request.revert, reverted_by=current_user["id"]):
+                metrics["bulk_deleted"] += step["deleted"] - last["deleted"]
+                last = step
+                yield json.dumps(step) + "\n"
+        except Exception as e:
+            # The 200 is already sent; report how far it got so the retry can be judged
+            logging.error(f"Bulk delete error in guild {guild_id}: {e}")
+            yield json.dumps({**last, "lifted": [], "error": str(e)}) + "\n"
+    
+    return StreamingResponse(progress(), media_type="application/x-ndjson")
+
 # Statistics routes
 @api_router.get("/stats")
 async def get_bot_stats(current_user: dict = Depends(get_current_user)):
@@ -327,19 +597,19 @@ async def get_bot_stats(current_user: dict = Depends(get_current_user)):
     if current_user["id"] != BOT_OWNER_ID:
         raise HTTPException(status_code=403, detail="Access denied")
     
-    # Get stats from database
-    total_warnings = await db.moderation_actions.count_documents({"action_type": "warn"})
-    total_bans = await db.moderation_actions.count_documents({"action_type": "ban"})
-    total_kicks = await db.moderation_actions.count_documents({"action_type": "kick"})
-    total_mutes = await db.moderation_actions.count_documents({"action_type": "mute"})
+    # Get stats from every partition concurrently and merge them
+    per_partition = await partitions.fan_out(lambda p: count_actions(p.storage.actions, {}))
+    counts = Counter()
+    for partition_counts in per_partition:
+        counts.update(partition_counts)
     
     stats = BotStats(
         guild_count=0,  # Would get from Discord bot
         user_count=0,   # Would get from Discord bot
-        total_warnings=total_warnings,
-        total_bans=total_bans,
-        total_kicks=total_kicks,
-        total_mutes=total_mutes,
+        total_warnings=counts.get("warn", 0),
+        total_bans=counts.get("ban", 0),
+        total_kicks=counts.get("kick", 0),
+        total_mutes=counts.get("mute", 0),
         uptime="0 days"  # Would get from Discord bot
     )
     
@@ -356,31 +626,69 @@ async def get_guild_stats(
         raise HTTPException(status_code=403, detail="Access denied")
     
     # Get guild-specific stats
-    total_warnings = await db.moderation_actions.count_documents({
-        "guild_id": guild_id,
-        "action_type": "warn"
-    })
-    total_bans = await db.moderation_actions.count_documents({
-        "guild_id": guild_id,
-        "action_type": "ban"
-    })
-    total_kicks = await db.moderation_actions.count_documents({
-        "guild_id": guild_id,
-        "action_type": "kick"
-    })
-    total_mutes = await db.moderation_actions.count_documents({
-        "guild_id": guild_id,
-        "action_type": "mute"
-    })
+    part = partitions.for_guild(guild_id)
+    counts = await count_actions(part.storage.actions, {"guild_id": guild_id})
     
     return {
         "guild_id": guild_id,
-        "total_warnings": total_warnings,
-        "total_bans": total_bans,
-        "total_kicks": total_kicks,
-        "total_mutes": total_mutes
+        "total_warnings": counts.get("warn", 0),
+        "total_bans": counts.get("ban", 0),
+        "total_kicks": counts.get("kick", 0),
+        "total_mutes": counts.get("mute", 0)
     }
 
+# Data import routes
+croxydb_import_task: Optional[asyncio.Task] = None
+croxydb_import_progress = ImportProgress()
+
+@api_router.post("/admin/import/croxydb")
+async def start_croxydb_import(
+    request: CroxydbImportRequest,
+    current_user: dict = Depends(get_current_user)
+):
+    """Start importing the bot's croxydb store into moderation actions"""
+    global croxydb_import_task, croxydb_import_progress
+    # Only bot owner can run imports
+    if current_user["id"] != BOT_OWNER_ID:
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    if croxydb_import_task and not croxydb_import_task.done():
+        raise HTTPException(status_code=409, detail="Import already running")
+    
+    path = Path(request.path)
+    if not path.is_file():
+        raise HTTPException(status_code=400, detail="croxydb file not found")
+    
+    croxydb_import_progress = ImportProgress()
+    progress = croxydb_import_progress
+    
+    async def run_import():
+        try:
+            await import_croxydb(
+                RoutedStore(partitions),
+                path,
+                batch_size=request.batch_size,
+                checkpoint=path.with_name(path.name + ".checkpoint.json"),
+                resume=request.resume,
+                progress=progress
+            )
+        except Exception as e:
+            logging.error(f"croxydb import error: {e}")
+            progress.error = str(e)
+    
+    croxydb_import_task = asyncio.create_task(run_import())
+    return {"message": "Import started", "progress": progress.dict()}
+
+@api_router.get("/admin/import/croxydb")
+async def get_croxydb_import_progress(current_user: dict = Depends(get_current_user)):
+    """Get progress of the current or last croxydb import"""
+    # Only bot owner can see imports
+    if current_user["id"] != BOT_OWNER_ID:
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    running = croxydb_import_task is not None and not croxydb_import_task.done()
+    return {"running": running, "progress": croxydb_import_progress.dict()}
+
 # AI management routes
 @api_router.post("/guilds/{guild_id}/ai/toggle")
 async def toggle_ai_for_channel(
@@ -395,7 +703,8 @@ async def toggle_ai_for_channel(
         raise HTTPException(status_code=403, detail="Access denied")
     
     # Update AI settings
-    await db.ai_settings.update_one(
+    part = partitions.for_guild(guild_id, write=True)
+    await part.db.ai_settings.update_one(
         {"guild_id": guild_id, "channel_id": channel_id},
         {"$set": {"enabled": enabled, "updated_at": datetime.utcnow()}},
         upsert=True
@@ -413,34 +722,161 @@ async def get_ai_settings(
     if not await is_user_admin_in_guild(guild_id, current_user["id"]):
         raise HTTPException(status_code=403, detail="Access denied")
     
-    settings = await db.ai_settings.find({"guild_id": guild_id}).to_list(100)
+    part = partitions.for_guild(guild_id)
+    settings = await part.db.ai_settings.find({"guild_id": guild_id}).to_list(100)
     
     return {"ai_settings": settings}
 
 # Health check
 @api_router.get("/health")
 async def health_check():
-    """Health check endpoint"""
-    return {"status": "healthy", "timestamp": datetime.utcnow()}
+    """Liveness check endpoint; see /ready for dependencies"""
+    return {"status": "healthy", "timestamp": datetime.utcnow(), "admission": admission.snapshot()}
+
+async def ping_discord():
+    async with http_session.get(f"{DISCORD_API}/gateway") as response:
+        response.raise_for_status()
+        await response.read()
+
+discord_status = CachedCheck(ping_discord, READY_PING_TIMEOUT, DISCORD_PING_TTL)
+
+@api_router.get("/ready")
+async def readiness_check():
+    """Readiness check: 503 until dependencies are initialized and answering"""
+    async def check_partition(part):
+        result = await ping(lambda: part.client.admin.command("ping"), READY_PING_TIMEOUT)
+        for listener in part.listeners:
+            if isinstance(listener, PoolStats):
+                result["pool"] = listener.dict(part.client.options.pool_options.max_pool_size)
+        return result
+
+    mongo = {}
+    if partitions.connected:
+        results = await partitions.fan_out(check_partition)
+        mongo = {part.name: result for part, result in zip(partitions.partitions, results)}
+    # Discord is reported but doesn't gate readiness: only login and guild listing need it
+    discord_api = await discord_status() if http_session is not None else None
+
+    ready = readiness.initialized and bool(mongo) and all(r["ok"] for r in mongo.values())
+    content = {
+        "status": "ready" if ready else "not_ready",
+        "serving": readiness.serving,
+        "initialized": readiness.initialized,
+        "startup_ms": round(readiness.ready_after * 1000, 1) if readiness.ready_after is not None else None,
+        "last_error": readiness.last_error,
+        "dependencies": {"mongo": mongo, "discord": discord_api},
+    }
+    return JSONResponse(status_code=200 if ready else 503, content=jsonable_encoder(content))
+
+@api_router.get("/admin/slow-requests")
+async def get_slow_requests(current_user: dict = Depends(get_current_user)):
+    """Get recently profiled/slow requests and slow Mongo queries"""
+    # Only bot owner can see profiling data
+    if current_user["id"] != BOT_OWNER_ID:
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    return {
+        "requests": list(reversed(profiler.slow_requests)),
+        "queries": list(reversed(profiler.slow_queries))
+    }
+
+@api_router.get("/metrics")
+async def get_metrics(current_user: dict = Depends(get_current_user)):
+    """Get process-local counters"""
+    # Only bot owner can see metrics
+    if current_user["id"] != BOT_OWNER_ID:
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    return {"metrics": dict(metrics), "admission": admission.snapshot()}
 
 # Bot communication routes (for Discord bot to sync data)
 @api_router.post("/bot/sync/moderation")
-async def sync_moderation_action(action: ModerationAction):
+async def sync_moderation_action(
+    action: ModerationAction,
+    idempotency_key: Optional[str] = Header(None)
+):
     """Sync moderation action from Discord bot"""
     # This would typically have some authentication
+    action.idempotency_key = action.idempotency_key or idempotency_key
+    part = partitions.for_guild(action.guild_id, write=True)
+    if not action.idempotency_key:
+        await part.storage.current.insert(action.dict())
+        return await record_synced_action(part, action)
+    
+    dedupe_key = (action.guild_id, action.idempotency_key)
+    if sync_dedupe.seen(dedupe_key):
+        metrics["sync_duplicates_cached"] += 1
+        return {"message": "Action already synced", "duplicate": True}
+    
+    # A retry matches the first row's idempotency key and inserts nothing
+    inserted = await part.storage.current.insert(action.dict())
+    
+    sync_dedupe.add(dedupe_key)
+    if not inserted:
+        metrics["sync_duplicates"] += 1
+        return {"message": "Action already synced", "duplicate": True}
+    
+    return await record_synced_action(part, action)
+
+async def record_synced_action(part, action: ModerationAction) -> dict:
+    """Update the user's profile for a newly stored action and check escalation"""
+    metrics["sync_inserted"] += 1
     action_dict = action.dict()
-    await db.moderation_actions.insert_one(action_dict)
-    return {"message": "Action synced"}
+    profile = await record_action(part.db.moderation_profiles, action_dict)
+    
+    escalation = None
+    if action.action_type == "warn":
+        settings = await part.db.guild_settings.find_one(
+            {"guild_id": action.guild_id},
+            {"auto_mute_warnings": 1, "auto_mute_duration": 1, "auto_kick_warnings": 1, "auto_ban_warnings": 1}
+        )
+        escalation = evaluate_escalation(settings, profile, action_dict)
+        if escalation:
+            metrics["sync_escalations"] += 1
+    
+    return {"message": "Action synced", "counts": profile.get("counts", {}), "escalation": escalation}
 
 @api_router.get("/bot/settings/{guild_id}")
 async def get_bot_settings_for_guild(guild_id: str):
     """Get bot settings for Discord bot"""
-    settings = await db.guild_settings.find_one({"guild_id": guild_id})
+    settings = await partitions.for_guild(guild_id).db.guild_settings.find_one({"guild_id": guild_id})
     return settings or {}
 
 # Include the router in the main app
 app.include_router(api_router)
 
+@app.exception_handler(GuildMoving)
+async def guild_moving_handler(request: Request, exc: GuildMoving):
+    # rebalance.py holds writes only for the duration of the copy
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Guild data is being moved, try again shortly"},
+        headers={"Retry-After": str(int(STORAGE_REFRESH_SECONDS))}
+    )
+
+@app.exception_handler(PlacementsStale)
+async def placements_stale_handler(request: Request, exc: PlacementsStale):
+    # This replica can't tell where the guild lives until a refresh succeeds
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Guild placements are out of date, try again shortly"},
+        headers={"Retry-After": str(int(STORAGE_REFRESH_SECONDS))}
+    )
+
+# Until placements are loaded a request could hit the wrong partition or collection
+app.add_middleware(StartupGate, readiness=readiness)
+
+# Admission control runs inside CORS so rejections still carry CORS headers
+app.add_middleware(
+    AdmissionMiddleware,
+    controller=admission,
+    verify_token=has_valid_jwt,
+    bot_key=BOT_API_KEY
+)
+
+# Profiling wraps admission so queueing time shows up in slow requests
+app.add_middleware(ProfilingMiddleware, profiler=profiler)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -457,9 +893,53 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+async def initialize():
+    # Retried until Mongo answers, so a replica started before its database
+    # simply stays not-ready instead of failing its first requests
+    loop = asyncio.get_running_loop()
+    delay = 1
+    while True:
+        try:
+            # Building a client can block on DNS (mongodb+srv), so keep it off the loop
+            await loop.run_in_executor(None, functools.partial(partitions.connect, io_loop=loop))
+            await partitions.refresh()
+            await partitions.fan_out(ensure_partition_indexes)
+            readiness.mark_serving()
+            await partitions.fan_out(lambda part: prewarm_mongo(part.client, MONGO_PREWARM_CONNECTIONS))
+            readiness.last_error = None
+            break
+        except Exception as e:
+            readiness.last_error = str(e)
+            logging.error(f"Startup initialization error, retrying in {delay}s: {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30)
+
+    # Open the TLS connection to Discord before the first login needs it
+    discord_result = await discord_status()
+    if not discord_result["ok"]:
+        logging.warning(f"Discord pre-warm failed: {discord_result['error']}")
+
+    logger.info(f"Ready {readiness.mark_ready() * 1000:.0f} ms after import")
+    await refresh_partitions()
+
+async def ensure_partition_indexes(part):
+    # Backs idempotent bot sync and the per-guild timestamp scans
+    await part.storage.current.ensure_indexes()
+    await part.db.moderation_profiles.create_index(
+        [("guild_id", 1), ("user_id", 1)],
+        unique=True,
+        name="guild_user_unique"
+    )
+
+async def refresh_partitions():
+    # Picks up guild moves (rebalance.py) and storage cutovers
+    # (migrate_timeseries.py) without a restart
+    while True:
+        await asyncio.sleep(STORAGE_REFRESH_SECONDS)
+        try:
+            await partitions.refresh()
+        except Exception as e:
+            logging.error(f"Partition refresh error: {e}")
 
 # Root endpoint
 @app.get("/")
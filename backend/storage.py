@@ -0,0 +1,274 @@
+"""
+Storage layouts for moderation actions.
+
+- "standard": the original `moderation_actions` collection, one document per
+  action, idempotency enforced by a partial unique index.
+- "timeseries": a Mongo time-series collection (`moderation_actions_ts`) with
+  `timestamp` as timeField and `guild_id` as metaField, so per-guild time-range
+  scans read a few compressed buckets instead of individual documents.
+
+Time-series collections can't carry unique indexes or take upserts, so in
+that mode idempotency keys are claimed in a small side collection
+(`moderation_sync_keys`) before the action is inserted. Deleting by a non-meta
+field (e.g. the action `id`) needs MongoDB 7.0+.
+
+The active layout is stored in `storage_config` so that the migration tool can
+flip it while replicas are running; `ModerationStorage.refresh` picks it up.
+While a migration is running (`migrating` in the same document), deletes from
+the standard collection also leave a tombstone in `moderation_tombstones`, so
+the migration can apply them to copies it already made.
+"""
+
+import logging
+from typing import Dict, List, Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, CollectionInvalid, DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+STANDARD = "standard"
+TIMESERIES = "timeseries"
+STORAGE_MODES = (STANDARD, TIMESERIES)
+
+STANDARD_COLLECTION = "moderation_actions"
+TIMESERIES_COLLECTION = "moderation_actions_ts"
+SYNC_KEYS_COLLECTION = "moderation_sync_keys"
+TOMBSTONES_COLLECTION = "moderation_tombstones"
+CONFIG_ID = "moderation_actions"
+
+
+def tombstone(doc: Dict) -> Dict:
+    """What the migration needs to delete the time-series copy of `doc`"""
+    return {
+        "guild_id": doc["guild_id"],
+        "id": doc["id"],
+        # Same key migrate_timeseries.py gives copies of unkeyed actions
+        "idempotency_key": doc.get("idempotency_key") or f"migrated:{doc['id']}",
+    }
+
+
+class StandardStore:
+    mode = STANDARD
+
+    def __init__(self, collection, tombstones=None):
+        self.collection = collection
+        self.tombstones = tombstones
+        # Set from storage_config while migrate_timeseries.py is copying this collection
+        self.record_deletes = False
+
+    async def ensure_indexes(self):
+        await self.collection.create_index(
+            [("guild_id", 1), ("idempotency_key", 1)],
+            unique=True,
+            partialFilterExpression={"idempotency_key": {"$type": "string"}},
+            name="guild_idempotency_key_unique"
+        )
+        await self.collection.create_index([("guild_id", 1), ("timestamp", -1)], name="guild_timestamp")
+
+    async def insert(self, doc: Dict) -> bool:
+        """Store an action; False if its idempotency key was already stored"""
+        if not doc.get("idempotency_key"):
+            await self.collection.insert_one(doc)
+            return True
+        try:
+            result = await self.collection.update_one(
+                {"guild_id": doc["guild_id"], "idempotency_key": doc["idempotency_key"]},
+                {"$setOnInsert": doc},
+                upsert=True
+            )
+            return result.upserted_id is not None
+        except DuplicateKeyError:
+            # A concurrent retry won the upsert race
+            return False
+
+    async def insert_many(self, docs: List[Dict]) -> int:
+        """Store keyed actions in one unordered batch; returns how many were new"""
+        return len(await self.insert_batch(docs))
+
+    async def insert_batch(self, docs: List[Dict]) -> List[Dict]:
+        """Like insert_many, but returns the docs that were actually new"""
+        requests = [
+            UpdateOne(
+                {"guild_id": doc["guild_id"], "idempotency_key": doc["idempotency_key"]},
+                {"$setOnInsert": doc},
+                upsert=True
+            )
+            for doc in docs
+        ]
+        if not requests:
+            return []
+        try:
+            result = await self.collection.bulk_write(requests, ordered=False)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(err.get("code") != 11000 for err in errors):
+                raise
+            # A concurrent upsert of the same key won the race: that row is a
+            # duplicate, the rest of the batch still went in
+            return [docs[u["index"]] for u in sorted(e.details.get("upserted", []), key=lambda u: u["index"])]
+        return [docs[i] for i in sorted(result.upserted_ids)]
+
+    async def delete_one(self, query: Dict) -> Optional[Dict]:
+        doc = await self.collection.find_one_and_delete(query)
+        if doc is not None and self.record_deletes:
+            await self.tombstones.insert_one(tombstone(doc))
+        return doc
+
+    async def delete_batch(self, docs: List[Dict]) -> int:
+        """Delete previously read docs (needs their _id) in one round trip"""
+        result = await self.collection.delete_many({"_id": {"$in": [d["_id"] for d in docs]}})
+        if docs and self.record_deletes:
+            await self.tombstones.insert_many([tombstone(d) for d in docs])
+        return result.deleted_count
+
+
+class TimeSeriesStore:
+    mode = TIMESERIES
+
+    def __init__(self, collection, sync_keys):
+        self.collection = collection
+        self.sync_keys = sync_keys
+
+    async def ensure_indexes(self):
+        db = self.collection.database
+        try:
+            await db.create_collection(
+                self.collection.name,
+                timeseries={"timeField": "timestamp", "metaField": "guild_id", "granularity": "hours"}
+            )
+        except CollectionInvalid:
+            pass
+        await self.collection.create_index([("guild_id", 1), ("timestamp", -1)], name="guild_timestamp")
+        await self.sync_keys.create_index(
+            [("guild_id", 1), ("idempotency_key", 1)], unique=True, name="guild_idempotency_key_unique"
+        )
+
+    async def insert(self, doc: Dict) -> bool:
+        if not doc.get("idempotency_key"):
+            await self.collection.insert_one(doc)
+            return True
+        key = {"guild_id": doc["guild_id"], "idempotency_key": doc["idempotency_key"]}
+        try:
+            await self.sync_keys.insert_one(key)
+        except DuplicateKeyError:
+            return False
+        try:
+            await self.collection.insert_one(doc)
+        except Exception:
+            # Give the key back so the bot's retry isn't mistaken for a duplicate
+            await self.sync_keys.delete_one(key)
+            raise
+        return True
+
+    async def insert_many(self, docs: List[Dict]) -> int:
+        return len(await self.insert_batch(docs))
+
+    async def insert_batch(self, docs: List[Dict]) -> List[Dict]:
+        if not docs:
+            return []
+        keys = [{"guild_id": d["guild_id"], "idempotency_key": d["idempotency_key"]} for d in docs]
+        try:
+            await self.sync_keys.insert_many(keys, ordered=False)
+            fresh = docs
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            duplicates = {err["index"] for err in errors if err.get("code") == 11000}
+            if len(duplicates) != len(errors):
+                # Give back the keys this batch did claim, or a retry would skip their actions
+                failed = {err["index"] for err in errors}
+                claimed = [key for i, key in enumerate(keys) if i not in failed]
+                if claimed:
+                    await self.sync_keys.delete_many({"$or": claimed})
+                raise
+            fresh = [doc for i, doc in enumerate(docs) if i not in duplicates]
+        if fresh:
+            try:
+                await self.collection.insert_many(fresh, ordered=False)
+            except Exception:
+                # Release the keys so the batch can be retried (e.g. on resume)
+                await self.sync_keys.delete_many({"$or": [
+                    {"guild_id": d["guild_id"], "idempotency_key": d["idempotency_key"]} for d in fresh
+                ]})
+                raise
+        return fresh
+
+    async def delete_one(self, query: Dict) -> Optional[Dict]:
+        # find_one_and_delete isn't supported on time-series collections
+        doc = await self.collection.find_one(query)
+        if doc is None:
+            return None
+        await self.collection.delete_many({"guild_id": doc["guild_id"], "id": doc["id"]})
+        if doc.get("idempotency_key"):
+            await self.sync_keys.delete_one(
+                {"guild_id": doc["guild_id"], "idempotency_key": doc["idempotency_key"]}
+            )
+        return doc
+
+    async def delete_batch(self, docs: List[Dict]) -> int:
+        result = await self.collection.delete_many({"_id": {"$in": [d["_id"] for d in docs]}})
+        keys = [
+            {"guild_id": d["guild_id"], "idempotency_key": d["idempotency_key"]}
+            for d in docs if d.get("idempotency_key")
+        ]
+        if keys:
+            await self.sync_keys.delete_many({"$or": keys})
+        return result.deleted_count
+
+
+class ModerationStorage:
+    """Holds the store for the active layout of a database"""
+
+    def __init__(self, db, default_mode: str = STANDARD):
+        if default_mode not in STORAGE_MODES:
+            raise ValueError(f"Unknown storage mode: {default_mode}")
+        self.db = db
+        self.default_mode = default_mode
+        self.stores = {
+            STANDARD: StandardStore(db[STANDARD_COLLECTION], db[TOMBSTONES_COLLECTION]),
+            TIMESERIES: TimeSeriesStore(db[TIMESERIES_COLLECTION], db[SYNC_KEYS_COLLECTION]),
+        }
+        self.mode = default_mode
+
+    @property
+    def current(self):
+        return self.stores[self.mode]
+
+    @property
+    def actions(self):
+        """Collection that currently holds moderation actions"""
+        return self.current.collection
+
+    async def refresh(self) -> str:
+        """Re-read the active layout from storage_config (set by the migration tool)"""
+        config = await self.db.storage_config.find_one({"_id": CONFIG_ID})
+        mode = (config or {}).get("mode", self.default_mode)
+        if mode in STORAGE_MODES and mode != self.mode:
+            logger.info(f"Moderation storage switched from {self.mode} to {mode}")
+            self.mode = mode
+        self.stores[STANDARD].record_deletes = bool((config or {}).get("migrating"))
+        return self.mode
+
+    async def set_mode(self, mode: str):
+        await self.db.storage_config.update_one({"_id": CONFIG_ID}, {"$set": {"mode": mode}}, upsert=True)
+        self.mode = mode
+
+    async def set_migrating(self, migrating: bool):
+        """Tell replicas to record tombstones for standard-collection deletes"""
+        await self.db.storage_config.update_one(
+            {"_id": CONFIG_ID}, {"$set": {"migrating": migrating}}, upsert=True
+        )
+        self.stores[STANDARD].record_deletes = migrating
+
+
+def action_counts_pipeline(match: Dict) -> List[Dict]:
+    """One aggregation for all per-type counts, instead of a count per type"""
+    return [
+        {"$match": match},
+        {"$group": {"_id": "$action_type", "count": {"$sum": 1}}},
+    ]
+
+
+async def count_actions(collection, match: Dict) -> Dict[str, int]:
+    rows = await collection.aggregate(action_counts_pipeline(match)).to_list(None)
+    return {row["_id"]: row["count"] for row in rows}
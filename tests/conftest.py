@@ -0,0 +1,190 @@
+import sys
+from collections import Counter
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from pymongo import UpdateOne
+
+# The backend is a flat set of modules run from its own directory
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+from dedupe import DedupeWindow  # noqa: E402
+from partitioning import Partition, PartitionRouter  # noqa: E402
+
+
+class FakeClock:
+    """Manually advanced replacement for time.monotonic"""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def matches(doc, query):
+    """Whether `doc` satisfies a Mongo filter, for the operators the code uses"""
+    for key, cond in query.items():
+        if key == "$and":
+            if not all(matches(doc, q) for q in cond):
+                return False
+        elif key == "$or":
+            if not any(matches(doc, q) for q in cond):
+                return False
+        elif isinstance(cond, dict):
+            value = doc.get(key)
+            if "$in" in cond and value not in cond["$in"]:
+                return False
+            if "$nin" in cond and value in cond["$nin"]:
+                return False
+            if "$gte" in cond and not value >= cond["$gte"]:
+                return False
+            if "$lt" in cond and not value < cond["$lt"]:
+                return False
+        elif doc.get(key) != cond:
+            return False
+    return True
+
+
+class FakeCollection:
+    """Just enough of a Motor collection for the code under test
+
+    Every bulk_write is kept in `bulk_writes` and every pipeline in
+    `pipelines`; aggregations return nothing. Setting `broken` makes reads
+    fail like an unreachable server.
+    """
+
+    def __init__(self, name=None):
+        self.name = name
+        self.docs = []
+        self.pipelines = []
+        self.bulk_writes = []
+        self.broken = False
+        self._next_id = 0
+
+    def _store(self, doc):
+        self._next_id += 1
+        doc = {"_id": self._next_id, **doc}
+        self.docs.append(doc)
+        return doc
+
+    def _first(self, query):
+        if self.broken:
+            raise ConnectionError(f"{self.name} unreachable")
+        return next((doc for doc in self.docs if matches(doc, query)), None)
+
+    def _apply(self, query, update, upsert):
+        """Apply a $setOnInsert/$inc/$set update; returns (doc, upserted _id)"""
+        doc, upserted_id = self._first(query), None
+        if doc is None:
+            if not upsert:
+                return None, None
+            doc = self._store({**query, **update.get("$setOnInsert", {})})
+            upserted_id = doc["_id"]
+        for field, n in update.get("$inc", {}).items():
+            parent, name = field.split(".")
+            doc.setdefault(parent, {})[name] = doc.get(parent, {}).get(name, 0) + n
+        doc.update(update.get("$set", {}))
+        return doc, upserted_id
+
+    async def insert_one(self, doc):
+        self._store(doc)
+
+    async def insert_many(self, docs, ordered=True):
+        for doc in docs:
+            self._store(doc)
+
+    async def update_one(self, query, update, upsert=False):
+        _, upserted_id = self._apply(query, update, upsert)
+        return SimpleNamespace(upserted_id=upserted_id)
+
+    async def find_one_and_update(self, query, update, upsert=False, return_document=None, projection=None):
+        doc, _ = self._apply(query, update, upsert)
+        return dict(doc) if doc is not None else None
+
+    async def find_one(self, query, projection=None):
+        doc = self._first(query)
+        return dict(doc) if doc is not None else None
+
+    async def find_one_and_delete(self, query):
+        doc = self._first(query)
+        if doc is not None:
+            self.docs.remove(doc)
+        return doc
+
+    def find(self, query, projection=None):
+        if self.broken:
+            raise ConnectionError(f"{self.name} unreachable")
+        return FakeCursor([doc for doc in self.docs if matches(doc, query)])
+
+    async def count_documents(self, query):
+        return sum(1 for doc in self.docs if matches(doc, query))
+
+    async def delete_many(self, query):
+        before = len(self.docs)
+        self.docs = [doc for doc in self.docs if not matches(doc, query)]
+        return SimpleNamespace(deleted_count=before - len(self.docs))
+
+    async def bulk_write(self, requests, ordered=True):
+        self.bulk_writes.append(requests)
+        upserted_ids = {}
+        for index, request in enumerate(requests):
+            # Pipeline updates (e.g. clamped decrements) are only recorded
+            if isinstance(request, UpdateOne) and isinstance(request._doc, dict):
+                _, upserted_id = self._apply(request._filter, request._doc, request._upsert)
+                if upserted_id is not None:
+                    upserted_ids[index] = upserted_id
+        return SimpleNamespace(upserted_count=len(upserted_ids), upserted_ids=upserted_ids)
+
+    def aggregate(self, pipeline, **kwargs):
+        self.pipelines.append(pipeline)
+        return FakeCursor([])
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def limit(self, n):
+        return FakeCursor(self.docs[:n])
+
+    async def to_list(self, length):
+        return [dict(doc) for doc in self.docs[:length]]
+
+    async def __aiter__(self):
+        for doc in self.docs:
+            yield dict(doc)
+
+
+class FakeDatabase(dict):
+    def __missing__(self, name):
+        return self.setdefault(name, FakeCollection(name))
+
+    def __getattr__(self, name):
+        return self[name]
+
+
+class FakeClient(dict):
+    def __missing__(self, name):
+        return self.setdefault(name, FakeDatabase())
+
+
+@pytest.fixture
+def api(monkeypatch):
+    """TestClient for server.app backed by one in-memory partition, and its database"""
+    import server
+    from fastapi.testclient import TestClient
+
+    client = FakeClient()
+    monkeypatch.setattr(server, "partitions", PartitionRouter([Partition("default", client, "discord_bot")]))
+    monkeypatch.setattr(server, "sync_dedupe", DedupeWindow(ttl=300))
+    monkeypatch.setattr(server, "metrics", Counter())
+    monkeypatch.setattr(server.readiness, "serving", True)
+    # No `with`: the lifespan would connect to Mongo
+    return TestClient(server.app), client["discord_bot"]
@@ -0,0 +1,187 @@
+import asyncio
+
+from admission import (
+    AdmissionController,
+    AdmissionMiddleware,
+    PriorityGate,
+    TokenBucket,
+)
+
+
+BOT_KEY = "bot-secret"
+
+
+def make_app(delay: float):
+    async def app(scope, receive, send):
+        await asyncio.sleep(delay)
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+    return app
+
+
+def middleware(controller: AdmissionController, delay: float = 0):
+    return AdmissionMiddleware(
+        make_app(delay), controller, verify_token=lambda token: token == "valid", bot_key=BOT_KEY
+    )
+
+
+async def call(app, path: str, method: str = "GET", token: str = "valid", bot_key: str = None):
+    headers = [(b"authorization", f"Bearer {token}".encode())] if token else []
+    if bot_key:
+        headers.append((b"x-bot-key", bot_key.encode()))
+    scope = {"type": "http", "method": method, "path": path, "headers": headers}
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    start = messages[0]
+    return start["status"], dict(start["headers"])
+
+
+def test_token_bucket_refills_over_time(clock):
+    bucket = TokenBucket(rate=2, capacity=2, clock=clock)
+    assert bucket.try_acquire()[0]
+    assert bucket.try_acquire()[0]
+    allowed, wait = bucket.try_acquire()
+    assert not allowed
+    assert wait == 0.5
+    clock.now += 0.5
+    assert bucket.try_acquire()[0]
+
+
+def test_priority_gate_serves_bot_first():
+    async def scenario():
+        gate = PriorityGate(1)
+        assert await gate.acquire(1, 1)
+        order = []
+
+        async def waiter(priority, name):
+            await gate.acquire(priority, 1)
+            order.append(name)
+            gate.release()
+
+        tasks = [asyncio.create_task(waiter(1, "dashboard")), asyncio.create_task(waiter(0, "bot"))]
+        await asyncio.sleep(0)
+        gate.release()
+        await asyncio.gather(*tasks)
+        return order, gate.active
+
+    order, active = asyncio.run(scenario())
+    assert order == ["bot", "dashboard"]
+    assert active == 0
+
+
+def test_guild_rate_limit_returns_429_with_retry_after():
+    controller = AdmissionController(guild_rate=1, guild_burst=3)
+    app = middleware(controller)
+
+    async def scenario():
+        return [await call(app, "/api/guilds/111/stats") for _ in range(5)]
+
+    results = asyncio.run(scenario())
+    statuses = [status for status, _ in results]
+    assert statuses == [200, 200, 200, 429, 429]
+    assert results[-1][1][b"retry-after"] == b"1"
+
+    # Another guild is not affected by the noisy one
+    assert asyncio.run(call(app, "/api/guilds/222/stats"))[0] == 200
+
+
+def test_synthetic_overload_sheds_fast_and_keeps_bot_sync_flowing():
+    controller = AdmissionController(
+        max_concurrency=4,
+        route_concurrency=100,
+        guild_concurrency=100,
+        guild_rate=1000,
+        guild_burst=1000,
+        max_queue_time=0.05,
+        bot_max_queue_time=1.0,
+    )
+    app = middleware(controller, 0.1)
+
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        dashboard = [call(app, f"/api/guilds/{i % 3}/moderation/actions") for i in range(40)]
+        bot = [call(app, "/api/bot/sync/moderation", "POST", token=None, bot_key=BOT_KEY) for _ in range(8)]
+        results = await asyncio.gather(*dashboard, *bot)
+        return results[:40], results[40:], loop.time() - started
+
+    dashboard, bot, elapsed = asyncio.run(scenario())
+
+    shed = [headers for status, headers in dashboard if status == 503]
+    assert len(shed) >= 30
+    assert all(headers[b"retry-after"] for headers in shed)
+    assert all(status == 200 for status, _ in bot)
+    # Overload is answered quickly rather than piling up behind the event loop
+    assert elapsed < 1.0
+    assert controller.gate.active == 0
+    assert controller.snapshot()["shed"] == len(shed)
+
+
+def test_health_and_preflight_are_exempt():
+    controller = AdmissionController(max_concurrency=0, max_queue_time=0)
+    app = middleware(controller)
+    assert asyncio.run(call(app, "/api/health"))[0] == 200
+    assert asyncio.run(call(app, "/api/guilds/1/stats", "OPTIONS"))[0] == 200
+    assert asyncio.run(call(app, "/api/guilds/1/stats"))[0] == 503
+
+
+def test_anonymous_requests_cannot_drain_a_guild_bucket():
+    controller = AdmissionController(guild_rate=1, guild_burst=2)
+    app = middleware(controller)
+
+    async def scenario():
+        anonymous = [(await call(app, "/api/guilds/111/stats", token=None))[0] for _ in range(2)]
+        anonymous += [(await call(app, "/api/guilds/111/stats", token="junk"))[0] for _ in range(2)]
+        moderator = (await call(app, "/api/guilds/111/stats"))[0]
+        return anonymous, moderator
+
+    anonymous, moderator = asyncio.run(scenario())
+    assert anonymous == [200, 200, 429, 429]
+    assert moderator == 200
+
+
+def test_guild_buckets_are_bounded(clock):
+    controller = AdmissionController(max_guild_buckets=3, clock=clock)
+    app = middleware(controller)
+
+    async def scenario():
+        for guild_id in range(10):
+            await call(app, f"/api/guilds/{guild_id}/stats")
+
+    asyncio.run(scenario())
+    assert list(controller._guild_buckets) == ["7", "8", "9"]
+
+
+def test_bot_routes_need_the_bot_key_for_priority():
+    controller = AdmissionController(guild_rate=1, guild_burst=1)
+    app = middleware(controller)
+
+    async def scenario():
+        path = "/api/bot/settings/111"
+        impostor = [(await call(app, path, token=None, bot_key="guess"))[0] for _ in range(2)]
+        bot = [(await call(app, path, token=None, bot_key=BOT_KEY))[0] for _ in range(2)]
+        return impostor, bot
+
+    impostor, bot = asyncio.run(scenario())
+    # Without the key the request is an anonymous dashboard read, limits and all
+    assert impostor == [200, 429]
+    assert bot == [200, 200]
+
+
+def test_without_a_verifier_nothing_counts_as_authenticated():
+    controller = AdmissionController(guild_rate=1, guild_burst=1)
+    app = AdmissionMiddleware(make_app(0), controller)
+
+    async def scenario():
+        await call(app, "/api/guilds/111/stats")
+        return (await call(app, "/api/guilds/222/stats"))[0]
+
+    # Both requests landed in the shared anonymous bucket
+    assert asyncio.run(scenario()) == 429
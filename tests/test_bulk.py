@@ -0,0 +1,143 @@
+import asyncio
+import json
+from datetime import datetime
+
+import pytest
+
+from bulk import build_filter, delete_matching, record_many
+from partitioning import Partition
+from tests.conftest import FakeClient
+
+
+def make_part():
+    return Partition("p0", FakeClient(), "discord_bot")
+
+
+def action(i, action_type="ban", moderator="raid-mod"):
+    return {"id": f"a{i}", "guild_id": "g", "user_id": f"u{i}", "action_type": action_type,
+            "reason": "raid", "moderator_id": moderator, "timestamp": datetime(2024, 1, 1),
+            "duration": None, "idempotency_key": f"k{i}"}
+
+
+async def collect(steps):
+    return [step async for step in steps]
+
+
+def test_build_filter():
+    query = build_filter("g", moderator_id="m", user_ids=["1", "2"], since=datetime(2024, 1, 1))
+    assert query == {"guild_id": "g", "moderator_id": "m", "user_id": {"$in": ["1", "2"]},
+                     "timestamp": {"$gte": datetime(2024, 1, 1)}}
+
+
+def test_record_many_writes_one_batch_per_chunk_and_skips_duplicates():
+    part = make_part()
+    docs = [action(i) for i in range(250)]
+    steps = asyncio.run(collect(record_many(part, docs, chunk_size=100)))
+    assert [s["processed"] for s in steps] == [100, 200, 250]
+    assert steps[-1]["inserted"] == 250
+    assert len(part.storage.actions.bulk_writes) == 3
+    assert len(part.db.moderation_profiles.bulk_writes) == 3
+
+    again = asyncio.run(collect(record_many(part, docs[:100], chunk_size=100)))
+    assert again[-1]["inserted"] == 0
+
+
+def test_revert_deletes_matches_and_records_unbans_once():
+    part = make_part()
+    docs = [action(i) for i in range(120)] + [action(1000 + i, "warn", "other-mod") for i in range(5)]
+    asyncio.run(collect(record_many(part, docs)))
+
+    query = build_filter("g", moderator_id="raid-mod")
+    steps = asyncio.run(collect(delete_matching(part, query, revert=True, reverted_by="owner", chunk_size=50)))
+    assert [s["processed"] for s in steps] == [50, 100, 120]
+    assert steps[-1]["deleted"] == 120
+    assert sum(len(s["lifted"]) for s in steps) == 120
+
+    remaining = part.storage.actions.docs
+    assert sorted({d["action_type"] for d in remaining}) == ["unban", "warn"]
+    assert sum(1 for d in remaining if d["action_type"] == "warn") == 5
+
+
+def test_revert_interrupted_before_the_delete_loses_nothing_on_retry():
+    part = make_part()
+    asyncio.run(collect(record_many(part, [action(i) for i in range(3)])))
+    store = part.storage.current
+    delete_batch = store.delete_batch
+
+    async def lost_primary(docs):
+        raise ConnectionError("primary stepped down")
+
+    store.delete_batch = lost_primary
+    query = build_filter("g", moderator_id="raid-mod")
+    with pytest.raises(ConnectionError):
+        asyncio.run(collect(delete_matching(part, query, revert=True, reverted_by="owner")))
+    # The bans are still there, each already paired with its unban
+    assert sorted(d["action_type"] for d in part.storage.actions.docs) == ["ban"] * 3 + ["unban"] * 3
+
+    store.delete_batch = delete_batch
+    steps = asyncio.run(collect(delete_matching(part, query, revert=True, reverted_by="owner")))
+    assert [d["action_type"] for d in part.storage.actions.docs] == ["unban"] * 3
+    assert len(steps[-1]["lifted"]) == 3
+
+
+@pytest.fixture
+def owner(api):
+    import server
+
+    server.app.dependency_overrides[server.get_current_user] = lambda: {"id": server.BOT_OWNER_ID}
+    yield api
+    server.app.dependency_overrides.clear()
+
+
+class FailingStore:
+    """Stores the first chunk, then fails like a lost primary would"""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def insert_batch(self, docs):
+        self.calls += 1
+        if self.calls > 1:
+            raise ConnectionError("primary stepped down")
+        return docs
+
+
+def test_bulk_record_reports_a_mid_stream_failure(owner):
+    import server
+
+    client, db = owner
+    part = server.partitions.primary
+    part.storage.stores[part.storage.mode] = FailingStore()
+    actions = [{"user_id": str(i), "action_type": "ban", "reason": "raid"} for i in range(600)]
+
+    response = client.post("/api/guilds/111/moderation/actions/bulk", json={"actions": actions})
+    lines = [json.loads(line) for line in response.text.splitlines()]
+
+    assert lines[0] == {"processed": 500, "total": 600, "inserted": 500}
+    assert lines[-1] == {"processed": 500, "total": 600, "inserted": 500, "error": "primary stepped down"}
+
+
+def test_bulk_record_remembers_only_caller_keys_for_sync_retries(owner):
+    import server
+
+    client, db = owner
+    part = server.partitions.primary
+    part.storage.stores[part.storage.mode] = FailingStore()
+    actions = [{"user_id": "1", "action_type": "ban", "reason": "raid", "idempotency_key": "bot-retry"}]
+    actions += [{"user_id": str(i), "action_type": "ban", "reason": "raid"} for i in range(2, 50)]
+
+    client.post("/api/guilds/111/moderation/actions/bulk", json={"actions": actions})
+    # Generated bulk:{id} keys would only push real retry keys out of the window
+    assert len(server.sync_dedupe) == 1
+    assert server.sync_dedupe.seen(("111", "bot-retry"))
+
+
+def test_revert_dry_run_counts_what_revert_would_touch(owner):
+    client, db = owner
+    body = {"moderator_id": "raid-mod", "dry_run": True, "revert": True}
+
+    assert client.post("/api/guilds/111/moderation/actions/bulk-delete", json=body).json() == {
+        "matched": 0, "by_type": {}}
+    match = db.moderation_actions.pipelines[-1][0]["$match"]
+    assert match == {"$and": [{"guild_id": "111", "moderator_id": "raid-mod"},
+                              {"action_type": {"$nin": ["unban", "unmute"]}}]}
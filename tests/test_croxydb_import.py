@@ -0,0 +1,84 @@
+import asyncio
+import io
+import json
+
+from croxydb_import import import_croxydb, iter_entries, map_entry
+from storage import StandardStore
+from tests.conftest import FakeCollection
+
+STORE = {
+    "warnings_111_222": [
+        {"id": "1700000000000", "reason": "spam", "moderator": "999", "timestamp": 1700000000000},
+        {"id": "1700000000500", "reason": "küfür", "moderator": "999", "timestamp": 1700000000500},
+    ],
+    "mute_111_333": {"userId": "333", "reason": "flood", "moderator": "999",
+                     "timestamp": 1700000001000, "duration": 10},
+    "ban_444_555": {"userId": "555", "reason": "raid", "moderator": "888", "timestamp": 1700000002000},
+    "ai_111_777": False,
+    "counter": 12345,
+}
+
+
+def test_iter_entries_streams_across_tiny_chunks():
+    text = json.dumps(STORE, ensure_ascii=False, indent=2)
+    assert list(iter_entries(io.StringIO(text), chunk_size=3)) == list(STORE.items())
+    assert list(iter_entries(io.StringIO("{ }"))) == []
+
+
+def test_map_entry_covers_bot_keys_only():
+    warns = map_entry("warnings_111_222", STORE["warnings_111_222"])
+    assert [a["action_type"] for a in warns] == ["warn", "warn"]
+    assert warns[0]["guild_id"] == "111" and warns[0]["user_id"] == "222"
+    assert warns[0]["moderator_id"] == "999"
+    assert map_entry("mute_111_333", STORE["mute_111_333"])[0]["duration"] == 10
+    assert map_entry("ban_444_555", STORE["ban_444_555"])[0]["action_type"] == "ban"
+    assert map_entry("ai_111_777", False) == []
+    assert map_entry("counter", 1) == []
+
+
+def test_import_is_batched_idempotent_and_resumable(tmp_path):
+    path = tmp_path / "croxydb.json"
+    path.write_text(json.dumps(STORE), encoding="utf-8")
+    checkpoint = tmp_path / "checkpoint.json"
+    collection = FakeCollection()
+    store = StandardStore(collection)
+
+    progress = asyncio.run(import_croxydb(store, path, batch_size=2, checkpoint=checkpoint))
+    assert progress.done
+    assert progress.entries == len(STORE)
+    assert progress.actions == progress.inserted == 4
+    assert len(collection.docs) == 4
+    assert len(collection.bulk_writes) == 2
+
+    # Re-running from scratch writes nothing new
+    again = asyncio.run(import_croxydb(store, path, batch_size=2))
+    assert again.actions == 4 and again.inserted == 0
+
+    # A finished checkpoint is not resumed from: the whole file is read again
+    rerun = asyncio.run(import_croxydb(store, path, checkpoint=checkpoint, resume=True))
+    assert rerun.entries == len(STORE)
+    assert rerun.actions == 4 and rerun.inserted == 0
+
+
+def test_resume_skips_entries_only_for_the_same_file(tmp_path):
+    path = tmp_path / "croxydb.json"
+    path.write_text(json.dumps(STORE), encoding="utf-8")
+    checkpoint = tmp_path / "checkpoint.json"
+    store = StandardStore(FakeCollection())
+
+    asyncio.run(import_croxydb(store, path, batch_size=2, checkpoint=checkpoint))
+    # Pretend the run stopped after the first entry
+    interrupted = {**json.loads(checkpoint.read_text()), "entries": 1, "actions": 2, "inserted": 2, "done": False}
+    checkpoint.write_text(json.dumps(interrupted))
+
+    resumed = asyncio.run(import_croxydb(store, path, checkpoint=checkpoint, resume=True))
+    assert resumed.actions == 4 and resumed.inserted == 2
+
+    # The bot added a warning since: the same checkpoint no longer applies
+    checkpoint.write_text(json.dumps(interrupted))
+    updated = dict(STORE, warnings_111_222=STORE["warnings_111_222"] + [
+        {"id": "1700000009000", "reason": "spam", "moderator": "999", "timestamp": 1700000009000},
+    ])
+    path.write_text(json.dumps(updated), encoding="utf-8")
+    rerun = asyncio.run(import_croxydb(store, path, checkpoint=checkpoint, resume=True))
+    assert rerun.actions == 5 and rerun.inserted == 1
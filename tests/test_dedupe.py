@@ -0,0 +1,21 @@
+from dedupe import DedupeWindow
+
+
+def test_keys_expire_after_ttl(clock):
+    window = DedupeWindow(ttl=10, clock=clock)
+    window.add(("guild", "key"))
+    assert window.seen(("guild", "key"))
+    assert not window.seen(("other-guild", "key"))
+    clock.now += 10
+    assert not window.seen(("guild", "key"))
+    assert len(window) == 0
+
+
+def test_window_is_bounded(clock):
+    window = DedupeWindow(ttl=60, max_size=3, clock=clock)
+    for i in range(5):
+        window.add(i)
+    assert len(window) == 3
+    assert not window.seen(0)
+    assert not window.seen(1)
+    assert window.seen(4)
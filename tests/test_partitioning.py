@@ -0,0 +1,102 @@
+import asyncio
+from datetime import datetime
+
+import pytest
+
+from partitioning import GuildMoving, HashRing, Partition, PartitionRouter, PlacementsStale, RoutedStore
+from tests.conftest import FakeClient
+
+GUILDS = [str(10**17 + i * 7919) for i in range(5000)]
+
+
+def make_router(names, **kwargs):
+    return PartitionRouter([Partition(name, FakeClient(), "discord_bot") for name in names], **kwargs)
+
+
+def test_ring_spreads_guilds_and_moves_few_when_growing():
+    three = HashRing(["p0", "p1", "p2"])
+    four = HashRing(["p0", "p1", "p2", "p3"])
+    owners = [three.node_for(g) for g in GUILDS]
+    for name in ("p0", "p1", "p2"):
+        assert 0.2 < owners.count(name) / len(GUILDS) < 0.47
+
+    moved = [g for g, owner in zip(GUILDS, owners) if four.node_for(g) != owner]
+    # Only guilds claimed by the new partition move, roughly a quarter
+    assert all(four.node_for(g) == "p3" for g in moved)
+    assert 0.15 < len(moved) / len(GUILDS) < 0.35
+
+
+def test_placements_override_ring_and_block_writes_while_moving():
+    router = make_router(["p0", "p1"])
+    guild_id = GUILDS[0]
+    home = router.home_of(guild_id)
+    other = next(p for p in router.partitions if p is not home)
+
+    placements = router.primary.db.guild_placements
+    placements.docs.append({"guild_id": guild_id, "partition": other.name})
+    asyncio.run(router.refresh())
+    assert router.for_guild(guild_id) is other
+    assert router.for_guild(guild_id, write=True) is other
+
+    placements.docs[0]["moving_to"] = home.name
+    asyncio.run(router.refresh())
+    assert router.for_guild(guild_id) is other
+    with pytest.raises(GuildMoving):
+        router.for_guild(guild_id, write=True)
+
+
+def test_writes_are_refused_when_placements_go_stale(clock):
+    router = make_router(["p0", "p1"], stale_after=60, clock=clock)
+    guild_id = GUILDS[0]
+    with pytest.raises(PlacementsStale):
+        router.for_guild(guild_id, write=True)
+
+    asyncio.run(router.refresh())
+    clock.now += 60
+    assert router.for_guild(guild_id, write=True) is router.home_of(guild_id)
+
+    # Refreshes keep failing: reads still work, writes stop once placements are too old
+    router.primary.db.guild_placements.broken = True
+    with pytest.raises(ConnectionError):
+        asyncio.run(router.refresh())
+    clock.now += 1
+    assert router.for_guild(guild_id) is router.home_of(guild_id)
+    with pytest.raises(PlacementsStale):
+        router.for_guild(guild_id, write=True)
+
+
+def test_one_partition_failing_its_refresh_does_not_stale_the_others(clock, caplog):
+    router = make_router(["p0", "p1"], stale_after=60, clock=clock)
+    broken = router.partitions[1]
+
+    async def unreachable(query):
+        raise ConnectionError("p1 unreachable")
+
+    broken.db.storage_config.find_one = unreachable
+    asyncio.run(router.refresh())
+    assert "partition p1" in caplog.text
+
+    clock.now += 30
+    for guild_id in GUILDS[:20]:
+        assert router.for_guild(guild_id, write=True) is router.home_of(guild_id)
+
+
+def test_routed_store_splits_batches_by_partition_and_fan_out_merges():
+    router = make_router(["p0", "p1", "p2"])
+    docs = [
+        {"guild_id": g, "user_id": "1", "action_type": "warn", "timestamp": datetime(2024, 1, 1), "idempotency_key": g}
+        for g in GUILDS[:300]
+    ]
+    assert asyncio.run(RoutedStore(router).insert_many(docs)) == 300
+
+    for partition in router.partitions:
+        stored = partition.storage.actions.docs
+        assert stored
+        assert all(router.home_of(d["guild_id"]) is partition for d in stored)
+        # New actions reach the profiles of the same partition
+        assert sum(map(len, partition.db.moderation_profiles.bulk_writes)) == len(stored)
+
+    async def count(partition):
+        return len(partition.storage.actions.docs)
+
+    assert sum(asyncio.run(router.fan_out(count))) == 300
@@ -0,0 +1,52 @@
+from datetime import datetime
+
+from profiles import evaluate_escalation, history_update, profile_update
+
+SETTINGS = {"auto_mute_warnings": 3, "auto_mute_duration": 30, "auto_ban_warnings": 5}
+
+
+def action(action_type, **extra):
+    return {"id": "a1", "guild_id": "1", "user_id": "2", "action_type": action_type,
+            "reason": "r", "moderator_id": "9", "timestamp": datetime(2024, 1, 1), **extra}
+
+
+def test_profile_update_increments_and_tracks_state():
+    update = profile_update(action("mute", duration=15))
+    assert update["$inc"] == {"counts.mute": 1}
+    assert update["$set"]["muted_until"] == datetime(2024, 1, 1, 0, 15)
+    assert update["$set"]["muted"] is True
+    # A mute without a duration is indefinite, not "not muted"
+    indefinite = profile_update(action("mute"))["$set"]
+    assert indefinite["muted"] is True and indefinite["muted_until"] is None
+    assert profile_update(action("unmute"))["$set"]["muted"] is False
+    assert update["$set"]["last_action"]["action_type"] == "mute"
+    assert profile_update(action("ban"))["$set"]["banned"] is True
+    assert profile_update(action("unban"))["$set"]["banned"] is False
+
+
+def test_escalation_fires_only_on_threshold():
+    def profile(warns):
+        return {"counts": {"warn": warns}}
+
+    assert evaluate_escalation(SETTINGS, profile(2), action("warn")) is None
+    assert evaluate_escalation(SETTINGS, profile(3), action("warn")) == {
+        "action_type": "mute", "reason": "3 warnings reached", "duration": 30}
+    assert evaluate_escalation(SETTINGS, profile(4), action("warn")) is None
+    assert evaluate_escalation(SETTINGS, profile(5), action("warn"))["action_type"] == "ban"
+    assert evaluate_escalation(SETTINGS, profile(3), action("kick")) is None
+    assert evaluate_escalation(None, profile(3), action("warn")) is None
+
+
+def test_history_update_sets_profile_from_newest_actions():
+    def group(action_type, count, day, **extra):
+        return {"action_type": action_type, "count": count,
+                "last": {**action(action_type, **extra), "timestamp": datetime(2024, 1, day)}}
+
+    update = history_update([
+        group("warn", 4, 5), group("mute", 2, 2, duration=10), group("unmute", 1, 3), group("ban", 1, 4),
+    ])["$set"]
+    assert update["counts"] == {"warn": 4, "mute": 2, "unmute": 1, "ban": 1}
+    assert update["last_action"]["action_type"] == "warn"
+    # The unmute came after the last mute; the ban was never lifted
+    assert update["muted"] is False and update["muted_until"] is None
+    assert update["banned"] is True
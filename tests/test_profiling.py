@@ -0,0 +1,96 @@
+import asyncio
+import contextvars
+import functools
+import time
+from types import SimpleNamespace
+
+from profiling import MongoSpanListener, ProfilingMiddleware, RequestProfiler, SlowQueryListener, span
+
+
+def busy(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+async def app(scope, receive, send):
+    with span("mongo.fake"):
+        await asyncio.sleep(0.03)
+    busy(0.03)
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def call(middleware, path):
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    await middleware({"type": "http", "method": "GET", "path": path, "headers": []}, receive, send)
+
+
+def test_disabled_by_default_and_span_is_noop():
+    profiler = RequestProfiler()
+    asyncio.run(call(ProfilingMiddleware(app, profiler), "/api/stats"))
+    assert not profiler.enabled
+    assert len(profiler.slow_requests) == 0
+    with span("outside-request"):
+        pass
+
+
+def test_slow_request_records_span_breakdown_and_profile():
+    profiler = RequestProfiler(sample_rate=1.0, slow_request_ms=20, sample_interval=0.001)
+    asyncio.run(call(ProfilingMiddleware(app, profiler), "/api/guilds/1/stats"))
+
+    entry = profiler.slow_requests[0]
+    assert entry["slow"] and entry["status"] == 200
+    assert entry["path"] == "/api/guilds/1/stats"
+    assert [s["name"] for s in entry["spans"]] == ["mongo.fake"]
+    assert entry["spans"][0]["ms"] >= 25
+    assert entry["unaccounted_ms"] >= 25
+    assert any("busy" in p["frame"] for p in entry["profile"])
+
+
+def test_fast_unsampled_requests_are_not_kept():
+    profiler = RequestProfiler(slow_request_ms=10_000)
+    asyncio.run(call(ProfilingMiddleware(app, profiler), "/api/stats"))
+    assert len(profiler.slow_requests) == 0
+
+
+def test_slow_query_listener_captures_command_without_session_fields():
+    profiler = RequestProfiler(slow_query_ms=50)
+    [listener] = [li for li in profiler.event_listeners() if isinstance(li, SlowQueryListener)]
+    command = {"find": "moderation_actions", "filter": {"guild_id": "1"}, "lsid": {}, "$db": "discord_bot"}
+    for request_id, micros in ((1, 10_000), (2, 80_000)):
+        started = SimpleNamespace(command_name="find", command=command, database_name="discord_bot",
+                                  connection_id=("localhost", 27017), request_id=request_id)
+        listener.started(started)
+        listener.succeeded(SimpleNamespace(command_name="find", duration_micros=micros,
+                                           connection_id=("localhost", 27017), request_id=request_id))
+
+    assert len(profiler.slow_queries) == 1
+    entry = profiler.slow_queries[0]
+    assert entry["duration_ms"] == 80
+    assert entry["filter"] == {"guild_id": "1"}
+    assert RequestProfiler().event_listeners() == []
+
+
+def test_mongo_commands_get_spans_from_executor_threads():
+    profiler = RequestProfiler(slow_request_ms=1)
+    [listener] = profiler.event_listeners()
+    assert isinstance(listener, MongoSpanListener)
+
+    def command():
+        # What Motor does: pymongo runs on a worker thread in a copy of the request's context
+        time.sleep(0.01)
+        listener.succeeded(SimpleNamespace(command_name="find", duration_micros=10_000))
+
+    async def mongo_app(scope, receive, send):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, functools.partial(contextvars.copy_context().run, command))
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+
+    asyncio.run(call(ProfilingMiddleware(mongo_app, profiler), "/api/bot/sync/moderation"))
+    assert profiler.slow_requests[0]["spans"] == [{"name": "mongo.find", "ms": 10.0}]
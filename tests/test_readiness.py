@@ -0,0 +1,90 @@
+import asyncio
+
+from partitioning import PartitionRouter
+from readiness import CachedCheck, PoolStats, Readiness, StartupGate, ping
+
+
+def test_lazy_router_creates_no_client_until_connect(monkeypatch):
+    monkeypatch.delenv("MONGO_PARTITIONS", raising=False)
+    monkeypatch.setenv("MONGO_URL", "mongodb://localhost:27017/?serverSelectionTimeoutMS=100")
+    router = PartitionRouter.from_env(lambda: [PoolStats()], lazy=True)
+    assert not router.connected
+    assert router.primary.db is None
+
+    router.connect()
+    try:
+        assert router.connected
+        assert isinstance(router.primary.listeners[0], PoolStats)
+        assert router.primary.db.name == "discord_bot"
+    finally:
+        router.close()
+
+
+def test_pool_stats_track_saturation():
+    stats = PoolStats()
+    for _ in range(4):
+        stats.connection_created(None)
+        stats.connection_checked_out(None)
+    stats.connection_checked_in(None)
+    stats.connection_check_out_failed(None)
+    assert stats.dict(10) == {"open": 4, "in_use": 3, "max": 10, "saturation": 0.3, "check_out_failures": 1}
+
+
+def test_ping_reports_failures_and_timeouts():
+    async def ok():
+        pass
+
+    async def broken():
+        raise ConnectionError("refused")
+
+    async def hangs():
+        await asyncio.sleep(1)
+
+    assert asyncio.run(ping(ok, 1))["ok"]
+    failed = asyncio.run(ping(broken, 1))
+    assert not failed["ok"] and failed["error"] == "refused"
+    assert asyncio.run(ping(hangs, 0.01))["error"] == "TimeoutError"
+
+
+def test_readiness_records_import_to_ready_time():
+    readiness = Readiness(import_started=0.0)
+    assert not readiness.initialized and readiness.ready_after is None
+    assert readiness.mark_ready() > 0
+    assert readiness.initialized
+
+
+def test_cached_check_reuses_its_result_within_ttl(clock):
+    calls = []
+
+    async def check():
+        calls.append(clock.now)
+
+    cached = CachedCheck(check, timeout=1, ttl=60, clock=clock)
+    assert asyncio.run(cached())["ok"]
+    clock.now += 59
+    assert asyncio.run(cached())["age_s"] == 59
+    clock.now += 1
+    asyncio.run(cached())
+    assert calls == [0, 60]
+
+
+def test_startup_gate_holds_routes_until_serving():
+    readiness = Readiness(import_started=0.0)
+
+    async def app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+
+    async def status(path):
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        await StartupGate(app, readiness)({"type": "http", "path": path}, None, send)
+        return messages[0]["status"]
+
+    assert asyncio.run(status("/api/guilds/1/moderation/actions")) == 503
+    assert asyncio.run(status("/api/health")) == 200
+    assert asyncio.run(status("/api/ready")) == 200
+    readiness.mark_serving()
+    assert asyncio.run(status("/api/guilds/1/moderation/actions")) == 200
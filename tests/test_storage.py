@@ -0,0 +1,82 @@
+import asyncio
+
+import pytest
+from pymongo.errors import BulkWriteError
+
+from storage import STANDARD, ModerationStorage, StandardStore, TimeSeriesStore
+from tests.conftest import FakeCollection, FakeDatabase
+
+
+class FakeKeys:
+    def __init__(self, fail_index=None):
+        self.keys = []
+        self.fail_index = fail_index
+
+    async def insert_many(self, keys, ordered=True):
+        errors = []
+        for i, key in enumerate(keys):
+            if i == self.fail_index:
+                errors.append({"index": i, "code": 121, "errmsg": "Document failed validation"})
+            elif key in self.keys:
+                errors.append({"index": i, "code": 11000, "errmsg": "duplicate key"})
+            else:
+                self.keys.append(key)
+        if errors:
+            raise BulkWriteError({"writeErrors": errors})
+
+    async def delete_many(self, query):
+        self.keys = [key for key in self.keys if key not in query["$or"]]
+
+
+def action(i):
+    return {"id": str(i), "guild_id": "1", "idempotency_key": f"k{i}"}
+
+
+def test_failed_key_claim_releases_the_keys_it_did_claim():
+    keys = FakeKeys(fail_index=1)
+    store = TimeSeriesStore(FakeCollection(), keys)
+    with pytest.raises(BulkWriteError):
+        asyncio.run(store.insert_batch([action(0), action(1), action(2)]))
+    assert keys.keys == []
+
+    # The retry is not mistaken for duplicates
+    keys.fail_index = None
+    assert len(asyncio.run(store.insert_batch([action(0), action(1), action(2)]))) == 3
+
+
+def test_deletes_leave_tombstones_only_while_migrating():
+    db = FakeDatabase()
+    storage = ModerationStorage(db, STANDARD)
+    store = storage.current
+    db.moderation_actions.docs.extend([action(0), {"id": "1", "guild_id": "1"}])
+
+    asyncio.run(store.delete_one({"id": "0"}))
+    assert db.moderation_tombstones.docs == []
+
+    db.storage_config.find_one = lambda query: asyncio.sleep(0, {"mode": STANDARD, "migrating": True})
+    asyncio.run(storage.refresh())
+    asyncio.run(store.delete_one({"id": "1"}))
+    [recorded] = db.moderation_tombstones.docs
+    assert recorded.items() >= {"guild_id": "1", "id": "1", "idempotency_key": "migrated:1"}.items()
+
+
+def test_standard_batch_racing_another_upsert_keeps_the_rows_it_inserted():
+    class RacingCollection:
+        async def bulk_write(self, requests, ordered=True):
+            # Row 1 lost the race to a concurrent upsert of the same key
+            raise BulkWriteError({
+                "writeErrors": [{"index": 1, "code": 11000, "errmsg": "duplicate key"}],
+                "upserted": [{"index": 2, "_id": "c"}, {"index": 0, "_id": "a"}],
+            })
+
+    fresh = asyncio.run(StandardStore(RacingCollection()).insert_batch([action(0), action(1), action(2)]))
+    assert fresh == [action(0), action(2)]
+
+
+def test_standard_batch_reraises_other_write_errors():
+    class FailingCollection:
+        async def bulk_write(self, requests, ordered=True):
+            raise BulkWriteError({"writeErrors": [{"index": 0, "code": 121, "errmsg": "validation"}], "upserted": []})
+
+    with pytest.raises(BulkWriteError):
+        asyncio.run(StandardStore(FailingCollection()).insert_batch([action(0)]))
@@ -0,0 +1,35 @@
+import server
+from dedupe import DedupeWindow
+
+ACTION = {"guild_id": "111", "user_id": "222", "action_type": "warn", "reason": "spam", "moderator_id": "999"}
+
+
+def test_retry_with_body_key_is_answered_from_the_dedupe_window(api):
+    client, db = api
+    action = {**ACTION, "idempotency_key": "bot:msg:1"}
+
+    first = client.post("/api/bot/sync/moderation", json=action).json()
+    retry = client.post("/api/bot/sync/moderation", json=action).json()
+
+    assert first["message"] == "Action synced" and first["counts"] == {"warn": 1}
+    assert retry == {"message": "Action already synced", "duplicate": True}
+    assert len(db["moderation_actions"].docs) == 1
+    assert server.metrics == {"sync_inserted": 1, "sync_duplicates_cached": 1}
+
+
+def test_retry_with_header_key_is_deduplicated_by_the_store(api, monkeypatch):
+    client, db = api
+    headers = {"Idempotency-Key": "bot:msg:2"}
+
+    first = client.post("/api/bot/sync/moderation", json=ACTION, headers=headers).json()
+    # Another replica (or this one after a restart) has never seen the key
+    monkeypatch.setattr(server, "sync_dedupe", DedupeWindow(ttl=300))
+    retry = client.post("/api/bot/sync/moderation", json=ACTION, headers=headers).json()
+
+    assert first["message"] == "Action synced"
+    assert retry == {"message": "Action already synced", "duplicate": True}
+    [stored] = db["moderation_actions"].docs
+    assert stored["idempotency_key"] == "bot:msg:2"
+    [profile] = db["moderation_profiles"].docs
+    assert profile["counts"] == {"warn": 1}
+    assert server.metrics == {"sync_inserted": 1, "sync_duplicates": 1}